@@ -4,13 +4,30 @@ from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from dotenv import load_dotenv
 import logging
+import signal
 import threading
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from slack_sdk.errors import SlackApiError
-from database import SheetManager
+from database import SheetManager, new_ticket_id
+from escalation import create_escalator, load_policy, mention
+from memory import MemoryMonitor
+from recovery import (
+    recover_tickets,
+    recovery_due,
+    reflected_metadata,
+    ticket_metadata,
+)
+from reminders import Scheduler
+from tickets import (
+    CLOSED_STATUSES,
+    OPEN_STATUSES,
+    TicketPayload,
+    TicketRecord,
+    compact_files,
+    create_ticket_manager,
+)
 import pytz
 import json
-import uuid
 
 load_dotenv(".env")
 
@@ -73,6 +90,26 @@ thank_you_pattern = re.compile(
     r".*(makasih|thank|thx|maaci|suwun|nuhun).*", re.IGNORECASE
 )
 
+mention_pattern = re.compile(r"<(?:@|!subteam\^)(\w+)")
+
+TICKET_QUERY_LIMIT = 20
+# Admin subcommands of /hiops start with this, so an issue report that
+# happens to begin with "tickets" or "memory" still becomes a ticket.
+ADMIN_COMMAND_PREFIX = "--"
+TICKET_CATEGORIES = ("Others", "Emergency", "IT Helpdesk", "Piket")
+
+omar_id = "U020SH7JJF3"
+HIOPS_ADMINS = [user for user in os.getenv("HIOPS_ADMINS", omar_id).split(",") if user]
+
+# Minutes after a ticket is posted, and whom to mention then, while nobody
+# has picked it up. ESCALATION_POLICY can replace any category's ladder.
+ESCALATION_POLICY = {
+    "Others": [(3, [omar_id]), (10, [omar_id]), (30, ["here"])],
+    "Emergency": [(5, [omar_id]), (15, ["here"])],
+    "IT Helpdesk": [(10, [helpdesk_support_id]), (30, [helpdesk_support_id, omar_id])],
+    "Piket": [(15, [omar_id]), (60, ["here"])],
+}
+
 
 def convert_utc_to_jakarta(time):
     utc_time = time.replace(tzinfo=pytz.utc)
@@ -81,77 +118,98 @@ def convert_utc_to_jakarta(time):
     return changed_timezone.strftime("%Y-%m-%d %H:%M:%S")
 
 
-class TicketManager:
-    def __init__(self):
-        self.reflected_timestamps = {}
-        self.user_inputs = {}
-        self.ticket_status = {}
-        self.files = {}
-        self.unique_id = {}
-
-    def store_reflected_ts(self, thread_ts, reflected_ts):
-        self.reflected_timestamps[thread_ts] = reflected_ts
-
-    def get_reflected_ts(self, thread_ts):
-        return self.reflected_timestamps.get(thread_ts)
-
-    def clear_reflected_ts(self, thread_ts):
-        if thread_ts in self.reflected_timestamps:
-            del self.reflected_timestamps[thread_ts]
-
-    def store_unique_id(self, thread_ts, id):
-        self.unique_id[thread_ts] = id
-
-    def get_unique_id(self, thread_ts):
-        return self.unique_id.get(thread_ts)
-
-    def store_user_input(self, thread_ts, user_input):
-        self.user_inputs[thread_ts] = user_input
-
-    def get_user_input(self, thread_ts):
-        return self.user_inputs.get(thread_ts)
-
-    def clear_user_input(self, thread_ts):
-        if thread_ts in self.user_inputs:
-            del self.user_inputs[thread_ts]
-
-    def update_ticket_status(self, thread_ts, status):
-        self.ticket_status[thread_ts] = status
-
-    def get_ticket_status(self, thread_ts):
-        return self.ticket_status.get(thread_ts, "unassigned")
-
-    def clear_ticket_status(self, thread_ts):
-        if thread_ts in self.ticket_status:
-            del self.ticket_status[thread_ts]
-
-    def store_files(self, thread_ts, files):
-        self.files[thread_ts] = files
-
-    def get_files(self, thread_ts):
-        files = self.files.get(thread_ts)
-        return files
+ticket_manager = create_ticket_manager()
+reminder_scheduler = Scheduler()
+escalator = create_escalator(
+    ticket_manager, reminder_scheduler, load_policy(ESCALATION_POLICY), app.client
+)
+memory_monitor = MemoryMonitor(ticket_manager, reminder_scheduler, sheet_manager)
+
+
+# Field order of the "@@"-joined values on buttons posted before payloads were
+# kept server-side, by trailing category and number of parts.
+LEGACY_PAYLOAD_FIELDS = {
+    ("Others", 5): ("reporter", "reporter_ts", "user_input", "reported_at", "category"),
+    ("Others", 6): (
+        "reporter",
+        "reporter_ts",
+        "user_input",
+        "reported_at",
+        "assignee",
+        "category",
+    ),
+    ("Others", 7): (
+        "reporter",
+        "reporter_ts",
+        "user_input",
+        "reported_at",
+        "assignee",
+        "issue_category",
+        "category",
+    ),
+    ("Piket", 13): (
+        "reporter",
+        "reporter_ts",
+        "reported_at",
+        "class_date",
+        "teacher_requested",
+        "teacher_replace",
+        "grade",
+        "slot_name",
+        "time_class",
+        "reason",
+        "direct_lead",
+        "stem_lead",
+        "category",
+    ),
+    ("Emergency", 3): ("reporter", "reporter_ts", "category"),
+    ("Emergency", 4): ("reporter", "reporter_ts", "ticket_id", "category"),
+    ("IT Helpdesk", 10): (
+        "ticket_id",
+        "reporter",
+        "reporter_ts",
+        "full_name",
+        "reported_at",
+        "issue_type",
+        "user_input",
+        "urgency_level",
+        "incident_at",
+        "category",
+    ),
+}
 
 
-ticket_manager = TicketManager()
+def load_payload(value, legacy_fields=None):
+    """Returns the payload behind a button value or private_metadata key.
 
+    Values posted before payloads were kept server-side carry the fields
+    themselves: `legacy_fields` names them in order, and by default they are
+    looked up in LEGACY_PAYLOAD_FIELDS. Unknown keys give an empty payload.
+    """
+    if "@@" not in value:
+        payload = ticket_manager.get_payload(value)
+        if payload is None:
+            logging.error(f"Payload {value} is missing or expired")
+            return TicketPayload()
+        return payload
+    parts = value.split("@@")
+    if legacy_fields is None:
+        legacy_fields = LEGACY_PAYLOAD_FIELDS.get((parts[-1], len(parts)), ())
+    return TicketPayload(**dict(zip(legacy_fields, parts)))
 
-def schedule_reminder(client, channel_id, thread_ts, reminder_time, ticket_ts):
-    def remind():
-        if not is_ticket_assigned(ticket_ts):
-            omar_id = "U020SH7JJF3"
-            client.chat_postMessage(
-                channel=channel_id,
-                thread_ts=thread_ts,
-                text=f"Ribbit! 🐸 Pepe’s getting impatient, and this ticket's feeling lonely! Can you <@{omar_id}> hop in and rescue it within the next 2 minutes before Pepe starts croaking louder? 🐸⏳",
-            )
 
-    threading.Timer(reminder_time.total_seconds(), remind).start()
+def release_ticket(thread_ts, claimed_status, previous_status):
+    """Moves a ticket a failed handler claimed as `claimed_status` back to
+    `previous_status`, so its buttons work again."""
+    if ticket_manager.transition(thread_ts, (claimed_status,), previous_status):
+        logging.info(f"Ticket {thread_ts} moved back to {previous_status}")
 
 
-def is_ticket_assigned(ticket_ts):
-    status = ticket_manager.get_ticket_status(ticket_ts)
-    return status != "unassigned"
+def metadata_for(ticket, payload_key=None):
+    """Message metadata describing `ticket` and the payload behind
+    `payload_key`, so recover_tickets can rebuild both from Slack."""
+    payload = ticket_manager.get_payload(payload_key) if payload_key else None
+    return ticket_metadata(ticket, payload_key, payload)
 
 
 def truncate_value(value, max_length=25):
@@ -342,9 +400,127 @@ def handle_message_events(body, say, client):
         logging.error(f"Error handling message: {str(e)}")
 
 
+def parse_ticket_query(args, user_id):
+    since = None
+    if args and args[-1] == "today":
+        args = args[:-1]
+        midnight = datetime.now(pytz.timezone("Asia/Jakarta")).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        since = midnight.timestamp()
+    if not args or args == ["mine"]:
+        return {"assignee": user_id, "status": OPEN_STATUSES}, since
+    if args == ["open"]:
+        return {"status": OPEN_STATUSES}, since
+    if len(args) == 1 and args[0] in OPEN_STATUSES + CLOSED_STATUSES:
+        return {"status": args[0]}, since
+    field, value = args[0], " ".join(args[1:])
+    if field in ["reporter", "assignee"] and value:
+        match = mention_pattern.search(value)
+        return {field: match.group(1) if match else value}, since
+    if field == "category" and value:
+        return {"category": value}, since
+    if field == "issue" and value:
+        return {"issue_category": value}, since
+    if field == "id" and value:
+        return {"ticket_id": value}, since
+    return None, since
+
+
+def format_ticket_line(ticket):
+    created_at = (
+        convert_utc_to_jakarta(datetime.fromtimestamp(ticket.created_at, timezone.utc))
+        if ticket.created_at
+        else "unknown"
+    )
+    category = ticket.category
+    if ticket.issue_category:
+        category = f"{category} ({ticket.issue_category})"
+    line = f"• `{ticket.ticket_id}` {category}: *{ticket.status}*"
+    if ticket.reporter:
+        line += f", reported by {mention(ticket.reporter)}"
+    if ticket.assignee:
+        line += f", assigned to {mention(ticket.assignee)}"
+    return f"{line} at `{created_at}`"
+
+
+def admin_command(text):
+    """Returns the subcommand `text` starts with, like "tickets" for
+    "--tickets open", or None for an issue report."""
+    words = text.split()
+    if words and words[0].startswith(ADMIN_COMMAND_PREFIX):
+        return words[0][len(ADMIN_COMMAND_PREFIX) :]
+    return None
+
+
+def is_ops_user(client, user_id):
+    """Whether `user_id` is an admin or a member of the ops channel."""
+    if user_id in HIOPS_ADMINS:
+        return True
+    try:
+        cursor = None
+        while True:
+            response = client.conversations_members(
+                channel=ops_cn, cursor=cursor, limit=1000
+            )
+            if user_id in response["members"]:
+                return True
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                return False
+    except SlackApiError as e:
+        logging.error(f"Failed to read the ops channel members: {str(e)}")
+        return False
+
+
+def answer_ticket_query(body, respond):
+    criteria, since = parse_ticket_query(body["text"].split()[1:], body["user_id"])
+    if criteria is None:
+        respond(
+            "Usage: `/hiops --tickets [mine | open | unassigned | <status> | "
+            "reporter @user | assignee @user | category <name> | id <ticket id>] "
+            "[today]`"
+        )
+        return
+    tickets = ticket_manager.find(since=since, **criteria)
+    if not tickets:
+        respond("No tickets found.")
+        return
+    header = f"Found {len(tickets)} ticket(s)"
+    if len(tickets) > TICKET_QUERY_LIMIT:
+        header += f", showing the newest {TICKET_QUERY_LIMIT}"
+    lines = [format_ticket_line(ticket) for ticket in tickets[:TICKET_QUERY_LIMIT]]
+    respond(header + ":\n" + "\n".join(lines))
+
+
+def answer_memory_query(body, respond):
+    args = body["text"].split()[1:]
+    if args == ["trace"]:
+        lines = memory_monitor.trace()
+    elif args == ["stop"]:
+        memory_monitor.stop_trace()
+        lines = ["Stopped tracemalloc."]
+    else:
+        lines = memory_monitor.report()
+    respond("```" + "\n".join(lines) + "```")
+
+
 @app.command("/hiops")
-def slash_input(ack, body, client):
+def slash_input(ack, body, client, respond):
     ack()
+    command = admin_command(body.get("text", ""))
+    if command == "tickets":
+        if not is_ops_user(client, body["user_id"]):
+            respond("`/hiops --tickets` is only available to the ops team.")
+            return
+        answer_ticket_query(body, respond)
+        return
+    if command == "memory":
+        if body["user_id"] not in HIOPS_ADMINS:
+            respond("`/hiops --memory` is only available to admins.")
+            return
+        answer_memory_query(body, respond)
+        return
     categories = ["Piket", "Emergency", "IT Helpdesk", "Others"]
     user_input = body.get("text", "No message provided.")
     category_options = [
@@ -396,7 +572,9 @@ def slash_input(ack, body, client):
                 ],
             },
         ],
-        "private_metadata": f"{channel_id}@@{user_input}",
+        "private_metadata": ticket_manager.store_payload(
+            TicketPayload(channel_id=channel_id, user_input=user_input)
+        ),
     }
 
     try:
@@ -464,7 +642,9 @@ def handling_replacement(ack, body, client):
                 },
             },
         ],
-        "private_metadata": f"{channel_id}@@Piket",
+        "private_metadata": ticket_manager.store_payload(
+            TicketPayload(channel_id=channel_id, category="Piket")
+        ),
     }
 
     try:
@@ -480,7 +660,8 @@ def handling_replacement(ack, body, client):
 @app.action("button_IT Helpdesk")
 def handle_category_selection(ack, body, client):
     ack()
-    [channel_id, user_input] = body["view"]["private_metadata"].split("@@")
+    payload = load_payload(body["view"]["private_metadata"], ())
+    user_input = payload.user_input
     piket_category = (
         body.get("view", {})
         .get("state", {})
@@ -490,7 +671,7 @@ def handle_category_selection(ack, body, client):
         .get("selected_option", {})
         .get("value", {})
     )
-    selected_category = body["actions"][0].get("value", user_input)
+    selected_category = body["actions"][0].get("value", payload.category)
     trigger_id = body["trigger_id"]
     if selected_category == "Piket":
         modal_blocks = [
@@ -778,7 +959,9 @@ def handle_category_selection(ack, body, client):
         "submit": {"type": "plain_text", "text": "Submit"},
         "close": {"type": "plain_text", "text": "Cancel"},
         "blocks": modal_blocks,
-        "private_metadata": f"{channel_id}@@{selected_category}",
+        "private_metadata": ticket_manager.store_payload(
+            payload.copy(category=selected_category)
+        ),
     }
 
     try:
@@ -1190,6 +1373,7 @@ def handle_emergency_button(ack, body, client, logger):
     user_name = get_real_name(client, user_id)
     timestamp_utc = datetime.now(timezone.utc)
     timestamp_jakarta = convert_utc_to_jakarta(timestamp_utc)
+    emergency_id = f"emergency-{new_ticket_id()}"
     feedback_block = [
         {
             "type": "section",
@@ -1246,7 +1430,14 @@ def handle_emergency_button(ack, body, client, logger):
         )
         if response["ok"]:
             user_ts = response["ts"]
-            value_key = f"{user_id}@@{user_ts}@@Emergency"
+            value_key = ticket_manager.store_payload(
+                TicketPayload(
+                    category="Emergency",
+                    reporter=user_id,
+                    reporter_ts=user_ts,
+                    ticket_id=emergency_id,
+                )
+            )
             emergency_block = [
                 {
                     "type": "section",
@@ -1279,22 +1470,30 @@ def handle_emergency_button(ack, body, client, logger):
                     ],
                 },
             ]
-            client.chat_postMessage(
+            ticket_fields = {
+                "ticket_id": emergency_id,
+                "reporter": user_id,
+                "category": "Emergency",
+            }
+            ops_response = client.chat_postMessage(
                 channel=ops_cn,
                 text="Emergency Alert! A critical situation has been reported. Please check immediately.",
                 blocks=emergency_block,
+                metadata=metadata_for(TicketRecord(**ticket_fields), value_key),
             )
+            if ops_response["ok"]:
+                ticket_manager.update(ops_response["ts"], **ticket_fields)
+                escalator.start(client, "Emergency", ops_cn, ops_response["ts"])
             reflected_response = client.chat_postMessage(
                 channel=emergency_reflected_cn,
                 text="Emergency Alert reported. Please refer to the main alert.",
                 blocks=info_channel_block,
+                metadata=reflected_metadata(user_ts, emergency_id),
             )
             if reflected_response["ok"]:
                 reflected_ts = reflected_response["ts"]
                 ticket_manager.store_reflected_ts(user_ts, reflected_ts)
-                sheet_manager.init_emergency(
-                    f"emergency-{user_ts}", user_name, timestamp_utc
-                )
+                sheet_manager.init_emergency(emergency_id, user_name, timestamp_utc)
 
             client.views_update(
                 view_id=body["view"]["id"],
@@ -1320,13 +1519,13 @@ def handle_emergency_button(ack, body, client, logger):
 @app.view("slash_input")
 def send_the_user_input(ack, body, client, say, view):
     ack()
-    private_metadata = view["private_metadata"].split("@@")
-    category = private_metadata[1]
-    channel_id = private_metadata[0]
+    payload = load_payload(view["private_metadata"], ())
+    category = payload.category
+    channel_id = payload.channel_id
     view_state = body["view"]["state"]["values"]
     user_id = body["user"]["id"]
     reporter_name = body["user"]["username"]
-    unique_id = str(uuid.uuid4())
+    unique_id = new_ticket_id()
     timestamp_utc = datetime.now(timezone.utc)
     timestamp_jakarta = convert_utc_to_jakarta(timestamp_utc)
 
@@ -1406,9 +1605,23 @@ def send_the_user_input(ack, body, client, say, view):
             text=f"We are sending the ticket information to <@{user_id}>",
         )
 
-        piket_data = f"{class_date}@@{teacher_requested}@@{teacher_replace}@@{grade}@@{slot_name}@@{time_class}@@{reason}@@{direct_lead}@@{stem_lead}"
-        ticket_key_for_user = f"{user_id}@@{response_for_user['ts']}@@{timestamp_jakarta}@@{piket_data}@@{category}"
-        ticket_key_for_request_teacher = f"{user_id}@@{response_for_user['ts']}@@{timestamp_jakarta}@@{class_date}@@{teacher_requested}@@{grade}@@{slot_name}@@{time_class}@@{reason}@@{direct_lead}@@{stem_lead}"
+        ticket_key_for_user = ticket_manager.store_payload(
+            TicketPayload(
+                category=category,
+                reporter=user_id,
+                reporter_ts=response_for_user["ts"],
+                reported_at=timestamp_jakarta,
+                class_date=class_date,
+                teacher_requested=teacher_requested,
+                teacher_replace=teacher_replace,
+                grade=grade,
+                slot_name=slot_name,
+                time_class=time_class,
+                reason=reason,
+                direct_lead=direct_lead,
+                stem_lead=stem_lead,
+            )
+        )
         teacher_replace_state = (
             f"<@{teacher_replace}>"
             if teacher_replace != "No Mentor"
@@ -1493,7 +1706,7 @@ def send_the_user_input(ack, body, client, say, view):
                             "emoji": True,
                             "text": "Edit",
                         },
-                        "value": ticket_key_for_request_teacher,
+                        "value": ticket_key_for_user,
                         "action_id": "edit_piket_msg",
                     },
                     {
@@ -1509,13 +1722,21 @@ def send_the_user_input(ack, body, client, say, view):
                     },
                 ]
 
+        ticket_fields = {
+            "unique_id": unique_id,
+            "ticket_id": f"piket.{unique_id}",
+            "reporter": user_id,
+            "category": "Piket",
+        }
         result = client.chat_postMessage(
             channel=piket_channel_id,
             text=f"please check the piket request from <@{teacher_requested}>",
             blocks=piket_message,
+            metadata=metadata_for(TicketRecord(**ticket_fields), ticket_key_for_user),
         )
         if result["ok"]:
-            ticket_manager.store_unique_id(result["ts"], unique_id)
+            ticket_manager.update(result["ts"], **ticket_fields)
+            escalator.start(client, "Piket", piket_channel_id, result["ts"])
         sheet_manager.init_piket_row(
             f"piket.{unique_id}",
             teacher_requested_name,
@@ -1576,8 +1797,6 @@ def send_the_user_input(ack, body, client, say, view):
         )
 
         try:
-            if helpdesk_files:
-                ticket_manager.store_files(unique_id, helpdesk_files)
             user_response = [
                 {
                     "type": "section",
@@ -1655,7 +1874,20 @@ def send_the_user_input(ack, body, client, say, view):
             )
             if user_msg["ok"]:
                 user_ts = user_msg["ts"]
-                values = f"{ticket_id}@@{user_id}@@{user_ts}@@{full_name}@@{timestamp_jakarta}@@{issue_type}@@{helpdesk_issue_description}@@{urgency_level}@@{date_time}@@{category}"
+                values = ticket_manager.store_payload(
+                    TicketPayload(
+                        category=category,
+                        ticket_id=ticket_id,
+                        reporter=user_id,
+                        reporter_ts=user_ts,
+                        full_name=full_name,
+                        reported_at=timestamp_jakarta,
+                        issue_type=issue_type,
+                        user_input=helpdesk_issue_description,
+                        urgency_level=urgency_level,
+                        incident_at=date_time,
+                    )
+                )
                 helpdesk_ticket_blocks = [
                     {
                         "type": "header",
@@ -1715,7 +1947,7 @@ def send_the_user_input(ack, body, client, say, view):
                                     "type": "plain_text",
                                     "text": "Start Chatting",
                                 },
-                                "value": f"{ticket_id}@@{user_id}@@{user_ts}",
+                                "value": values,
                                 "action_id": "start_chat",
                             },
                             {
@@ -1724,19 +1956,28 @@ def send_the_user_input(ack, body, client, say, view):
                                     "type": "plain_text",
                                     "text": "Queue",
                                 },
-                                "value": f"{ticket_id}@@{user_id}@@{user_ts}",
+                                "value": values,
                                 "action_id": "set_queue",
                             },
                         ],
                     },
                 ]
+                ticket_fields = {
+                    "unique_id": unique_id,
+                    "ticket_id": ticket_id,
+                    "reporter": user_id,
+                    "category": "IT Helpdesk",
+                }
                 response_for_staff = client.chat_postMessage(
                     channel=helpdesk_cn,
                     text=f"We just received a helpdesk request from {full_name}",
                     blocks=helpdesk_ticket_blocks,
+                    metadata=metadata_for(TicketRecord(**ticket_fields), values),
                 )
                 if response_for_staff["ok"]:
                     response_ts = response_for_staff["ts"]
+                    ticket_manager.update(response_ts, **ticket_fields)
+                    escalator.start(client, "IT Helpdesk", helpdesk_cn, response_ts)
                     if helpdesk_files:
                         inserting_imgs_thread(
                             client, helpdesk_cn, response_ts, helpdesk_files
@@ -1784,7 +2025,15 @@ def send_the_user_input(ack, body, client, say, view):
             ]
 
             response_for_user = client.chat_postMessage(channel=user_id, blocks=ticket)
-            ticket_key_for_user = f"{user_id}@@{response_for_user['ts']}@@{truncate_value(issue_description)}@@{timestamp_jakarta}@@{category}"
+            ticket_key_for_user = ticket_manager.store_payload(
+                TicketPayload(
+                    category=category,
+                    reporter=user_id,
+                    reporter_ts=response_for_user["ts"],
+                    user_input=issue_description,
+                    reported_at=timestamp_jakarta,
+                )
+            )
 
             members_result = client.conversations_members(channel=channel_id)
             if members_result["ok"]:
@@ -1806,7 +2055,7 @@ def send_the_user_input(ack, body, client, say, view):
                             else f"<!subteam^{member}>"
                         ),
                     },
-                    "value": f"{member}@@{user_id}@@{response_for_user['ts']}@@{truncate_value(issue_description)}@@{timestamp_jakarta}@@{category}",
+                    "value": f"{member}@@{ticket_key_for_user}",
                 }
                 for member in members
             ]
@@ -1895,10 +2144,21 @@ def send_the_user_input(ack, body, client, say, view):
                     },
                 ]
 
+            ticket_fields = {
+                "unique_id": unique_id,
+                "user_input": issue_description,
+                "files": compact_files(files),
+                "ticket_id": f"live-ops.{unique_id}",
+                "reporter": user_id,
+                "category": "Others",
+            }
             result = client.chat_postMessage(
                 channel=channel_id,
                 text=f"We received the ticket from <@{user_id}>",
                 blocks=blocks,
+                metadata=metadata_for(
+                    TicketRecord(**ticket_fields), ticket_key_for_user
+                ),
             )
 
             sheet_manager.init_ticket_row(
@@ -1909,11 +2169,10 @@ def send_the_user_input(ack, body, client, say, view):
                 timestamp_utc,
             )
             if result["ok"]:
-                ticket_manager.store_user_input(result["ts"], issue_description)
-                ticket_manager.store_unique_id(result["ts"], unique_id)
+                ticket_manager.update(result["ts"], **ticket_fields)
+                escalator.start(client, "Others", channel_id, result["ts"])
                 if files:
                     inserting_imgs_thread(client, channel_id, result["ts"], files)
-                    ticket_manager.store_files(result["ts"], files)
                 if len(issue_description) > 37:
                     client.chat_postMessage(
                         channel=channel_id,
@@ -1922,11 +2181,6 @@ def send_the_user_input(ack, body, client, say, view):
                     )
             else:
                 say("Failed to post message")
-
-            reminder_time = timedelta(minutes=3)
-            schedule_reminder(
-                client, channel_id, result["ts"], reminder_time, result["ts"]
-            )
         except Exception as e:
             logging.error(f"An error occurred: {str(e)}")
 
@@ -1934,7 +2188,11 @@ def send_the_user_input(ack, body, client, say, view):
 @app.action("set_queue")
 def handle_queue_ticket(ack, client, body):
     ack()
-    [ticket_id, user_id, user_ts] = body["actions"][0]["value"].split("@@")
+    payload = load_payload(
+        body["actions"][0]["value"], ("ticket_id", "reporter", "reporter_ts")
+    )
+    user_id = payload.reporter
+    user_ts = payload.reporter_ts
 
     try:
         client.chat_postMessage(
@@ -1946,6 +2204,7 @@ def handle_queue_ticket(ack, client, body):
         blocks = message["blocks"]
 
         blocks[1]["fields"][7]["text"] = "*Status:*\nOn Hold :pray:"
+        escalator.cancel(message["ts"])
 
         blocks[2]["elements"] = [
             button
@@ -1967,7 +2226,12 @@ def handle_queue_ticket(ack, client, body):
 @app.action("start_chat")
 def handle_start_chat(ack, client, body):
     ack()
-    [ticket_id, user_id, user_ts] = body["actions"][0]["value"].split("@@")
+    payload = load_payload(
+        body["actions"][0]["value"], ("ticket_id", "reporter", "reporter_ts")
+    )
+    ticket_id = payload.ticket_id
+    user_id = payload.reporter
+    user_ts = payload.reporter_ts
     staff_ts = body["message"]["ts"]
 
     try:
@@ -2003,6 +2267,7 @@ def handle_start_chat(ack, client, body):
             ],
         )
         start_ts = greeting["ts"]
+        escalator.cancel(staff_ts)
         message = body["message"]
         blocks = message["blocks"]
 
@@ -2016,15 +2281,22 @@ def handle_start_chat(ack, client, body):
 
         blocks[2]["elements"][0]["action_id"] = "helpdesk_resolve_post_chatting"
 
-        blocks[2]["elements"][0][
-            "value"
-        ] = f"{ticket_id}@@{user_id}@@{user_ts}@@{channel_id}@@{helpdesk_support_id}@@{staff_ts}@@{start_ts}"
+        resolve_key = ticket_manager.store_payload(
+            payload.copy(
+                conversation_id=channel_id,
+                support_id=helpdesk_support_id,
+                staff_ts=staff_ts,
+                chat_started_ts=start_ts,
+            )
+        )
+        blocks[2]["elements"][0]["value"] = resolve_key
 
         client.chat_update(
             channel=body["channel"]["id"],
             ts=message["ts"],
             text="We are updating this block.",
             blocks=blocks,
+            metadata=metadata_for(ticket_manager.get_ticket(staff_ts), resolve_key),
         )
     except Exception as e:
         logging.error(f"Any error when starting chat with error: {str(e)}")
@@ -2033,28 +2305,31 @@ def handle_start_chat(ack, client, body):
 @app.action("edit_piket_msg")
 def edit_piket_msg(ack, body, client):
     ack()
-    [
-        reporter_id,
-        report_ts,
-        timestamp,
-        class_date,
-        teacher_requested,
-        grade,
-        slot_name,
-        time_class,
-        reason,
-        direct_lead,
-        stem_lead,
-    ] = body["message"]["blocks"][4]["elements"][0]["value"].split("@@")
+    payload = load_payload(
+        body["message"]["blocks"][4]["elements"][0]["value"],
+        (
+            "reporter",
+            "reporter_ts",
+            "reported_at",
+            "class_date",
+            "teacher_requested",
+            "grade",
+            "slot_name",
+            "time_class",
+            "reason",
+            "direct_lead",
+            "stem_lead",
+        ),
+    )
     previous_values = {
-        "date": class_date,
-        "teacher_requested": teacher_requested,
-        "grade": grade,
-        "slot_name": slot_name,
-        "time_class": time_class,
-        "reason": reason,
-        "direct_lead": direct_lead,
-        "stem_lead": stem_lead,
+        "date": payload.class_date,
+        "teacher_requested": payload.teacher_requested,
+        "grade": payload.grade,
+        "slot_name": payload.slot_name,
+        "time_class": payload.time_class,
+        "reason": payload.reason,
+        "direct_lead": payload.direct_lead,
+        "stem_lead": payload.stem_lead,
     }
     thread_ts = body["container"]["message_ts"]
     channel_id = body["channel"]["id"]
@@ -2187,7 +2462,11 @@ def edit_piket_msg(ack, body, client):
         "submit": {"type": "plain_text", "text": "Submit"},
         "close": {"type": "plain_text", "text": "Cancel"},
         "blocks": modal_blocks,
-        "private_metadata": f"{reporter_id}@@{report_ts}@@{timestamp}@@{thread_ts}@@{channel_id}@@{unique_id}",
+        "private_metadata": ticket_manager.store_payload(
+            payload.copy(
+                thread_ts=thread_ts, channel_id=channel_id, unique_id=unique_id
+            )
+        ),
     }
 
     try:
@@ -2203,9 +2482,12 @@ def show_editted_piket_msg(ack, body, client, view, logger):
         user_id = body["user"]["id"]
         user_info = client.users_info(user=user_id)
         user_name = user_info["user"]["real_name"]
-        [reporter_id, report_ts, timestamp, thread_ts, channel_id, unique_id] = view[
-            "private_metadata"
-        ].split("@@")
+        payload = load_payload(view["private_metadata"], ())
+        reporter_id = payload.reporter
+        report_ts = payload.reporter_ts
+        thread_ts = payload.thread_ts
+        channel_id = payload.channel_id
+        unique_id = payload.unique_id
         class_date = view["state"]["values"]["date_block"]["date_picker_action"][
             "selected_date"
         ]
@@ -2297,6 +2579,8 @@ def show_editted_piket_msg(ack, body, client, view, logger):
             blocks=piket_message,
         )
         if response["ok"]:
+            ticket_manager.update(thread_ts, event="edited")
+            escalator.cancel(thread_ts)
             client.chat_postMessage(
                 channel=reporter_id,
                 thread_ts=report_ts,
@@ -2337,18 +2621,41 @@ def show_editted_piket_msg(ack, body, client, view, logger):
 @app.action("user_select_action")
 def handle_user_selection(ack, body, client):
     ack()
+    selected_user, payload_key = body["actions"][0]["selected_option"]["value"].split(
+        "@@", 1
+    )
+    payload = load_payload(payload_key)
+    thread_ts = body["container"]["message_ts"]
+    if not payload.reporter:
+        logging.error(f"Ticket {thread_ts} has no payload, ignoring assignment")
+        return
+    handing_over = selected_user in ["S05RYHJ41C6", "S02R59UL0RH", helpdesk_support_id]
+    claimed_status = "handed_over" if handing_over else "assigned"
+    ticket = ticket_manager.transition(
+        thread_ts, ("unassigned",), claimed_status, assignee=selected_user
+    )
+    if ticket is None:
+        logging.info(f"Ticket {thread_ts} was already taken, ignoring assignment")
+        return
+    try:
+        assign_ticket(client, body, ticket, payload, handing_over)
+        escalator.cancel(thread_ts)
+    except Exception as e:
+        logging.error(f"Error assigning ticket: {str(e)}")
+        release_ticket(thread_ts, claimed_status, "unassigned")
+
+
+def assign_ticket(client, body, ticket, payload, handing_over):
+    """Posts and records the assignment `handle_user_selection` claimed."""
     person_who_assigns = body["user"]["id"]
-    person_who_assigns_name = get_real_name(client, person_who_assigns)
-    [
-        selected_user,
-        user_who_requested,
-        response_ts,
-        user_input,
-        reported_at,
-        ticket_category,
-    ] = body["actions"][0]["selected_option"]["value"].split("@@")
+    selected_user = ticket.assignee
     channel_id = body["channel"]["id"]
     thread_ts = body["container"]["message_ts"]
+    user_who_requested = payload.reporter
+    response_ts = payload.reporter_ts
+    user_input = payload.user_input
+    reported_at = payload.reported_at
+    person_who_assigns_name = get_real_name(client, person_who_assigns)
     categories = [
         "Ajar",
         "Cuti",
@@ -2361,7 +2668,9 @@ def handle_user_selection(ack, body, client):
     ]
     timestamp_utc = datetime.now(timezone.utc)
     timestamp_jakarta = convert_utc_to_jakarta(timestamp_utc)
-    ticket_key_for_user = f"{user_who_requested}@@{response_ts}@@{truncate_value(user_input)}@@{reported_at}@@{selected_user}@@{ticket_category}"
+    ticket_key_for_user = ticket_manager.store_payload(
+        payload.copy(assignee=selected_user)
+    )
     category_options = [
         {
             "text": {"type": "plain_text", "text": category},
@@ -2370,11 +2679,10 @@ def handle_user_selection(ack, body, client):
         for category in categories
     ]
 
-    files = ticket_manager.get_files(thread_ts)
-    ticket_manager.update_ticket_status(thread_ts, "assigned")
-    unique_id = ticket_manager.get_unique_id(thread_ts)
+    files = ticket.files
+    unique_id = ticket.unique_id
 
-    if selected_user in ["S05RYHJ41C6", "S02R59UL0RH", helpdesk_support_id]:
+    if handing_over:
         user_info = client.users_info(user=body["user"]["id"])
         selected_user_name = user_info["user"]["real_name"]
         other_div_mention = (
@@ -2480,6 +2788,7 @@ def handle_user_selection(ack, body, client):
                 ts=thread_ts,
                 text=None,
                 blocks=updated_blocks,
+                metadata=metadata_for(ticket),
             )
             reflected_post = client.chat_postMessage(
                 channel=reflected_cn, blocks=reflected_msg
@@ -2489,7 +2798,7 @@ def handle_user_selection(ack, body, client):
                 if files:
                     inserting_imgs_thread(client, reflected_cn, ts, files)
 
-                full_user_input = ticket_manager.get_user_input(thread_ts)
+                full_user_input = ticket.user_input
                 client.chat_postMessage(
                     channel=reflected_cn,
                     thread_ts=ts,
@@ -2641,12 +2950,14 @@ def handle_user_selection(ack, body, client):
                 ts=thread_ts,
                 text=f"<@{selected_user}> picked up the issue.",
                 blocks=updated_blocks,
+                metadata=metadata_for(ticket, ticket_key_for_user),
             )
 
             reflected_post = client.chat_postMessage(
                 channel=reflected_cn,
                 text="sending the ticket to #guru_kakaksiaga_ops",
                 blocks=reflected_msg,
+                metadata=reflected_metadata(thread_ts, ticket.ticket_id),
             )
 
             if reflected_post["ok"]:
@@ -2654,7 +2965,7 @@ def handle_user_selection(ack, body, client):
                 ticket_manager.store_reflected_ts(thread_ts, reflected_ts)
                 if files:
                     inserting_imgs_thread(client, reflected_cn, reflected_ts, files)
-                full_user_input = ticket_manager.get_user_input(thread_ts)
+                full_user_input = ticket.user_input
                 if len(full_user_input) > 37:
                     client.chat_postMessage(
                         channel=reflected_cn,
@@ -2682,19 +2993,21 @@ def handle_user_selection(ack, body, client):
 def handle_category_selection(ack, body, client):
     ack()
     channel_id = body["channel"]["id"]
-    [
-        selected_category_name,
-        user_who_requested,
-        response_ts,
-        user_input,
-        reported_at,
-        selected_user,
-        ticket_category,
-    ] = body["actions"][0]["selected_option"]["value"].split("@@")
+    selected_category_name, payload_key = body["actions"][0]["selected_option"][
+        "value"
+    ].split("@@", 1)
+    payload = load_payload(payload_key)
+    user_who_requested = payload.reporter
+    reported_at = payload.reported_at
+    user_input = payload.user_input
+    selected_user = payload.assignee
     thread_ts = body["container"]["message_ts"]
-    reflected_ts = ticket_manager.get_reflected_ts(thread_ts)
-    unique_id = ticket_manager.get_unique_id(thread_ts)
-    ticket_key_for_user = f"{user_who_requested}@@{response_ts}@@{truncate_value(user_input)}@@{reported_at}@@{selected_user}@@{selected_category_name}@@{ticket_category}"
+    ticket = ticket_manager.get_ticket(thread_ts)
+    reflected_ts = ticket.reflected_ts
+    unique_id = ticket.unique_id
+    ticket_key_for_user = ticket_manager.store_payload(
+        payload.copy(issue_category=selected_category_name)
+    )
 
     if selected_category_name.lower() == "others":
         trigger_id = body["trigger_id"]
@@ -2716,7 +3029,9 @@ def handle_category_selection(ack, body, client):
                     },
                 }
             ],
-            "private_metadata": f"{thread_ts}@@{user_who_requested}@@{reported_at}@@{truncate_value(user_input)}@@{selected_user}@@{channel_id}@@{response_ts}@@{ticket_category}",
+            "private_metadata": ticket_manager.store_payload(
+                payload.copy(thread_ts=thread_ts, channel_id=channel_id)
+            ),
             "submit": {"type": "plain_text", "text": "Submit"},
         }
         client.views_open(trigger_id=trigger_id, view=modal_view)
@@ -2813,8 +3128,13 @@ def handle_category_selection(ack, body, client):
             },
         ]
 
+        ticket = ticket_manager.update(thread_ts, issue_category=selected_category_name)
         client.chat_update(
-            channel=channel_id, ts=thread_ts, text=None, blocks=updated_blocks
+            channel=channel_id,
+            ts=thread_ts,
+            text=None,
+            blocks=updated_blocks,
+            metadata=metadata_for(ticket, ticket_key_for_user),
         )
 
         client.chat_update(
@@ -2834,19 +3154,19 @@ def handle_custom_category_modal_submission(ack, body, client, view, logger):
     custom_category = view["state"]["values"]["custom_category_block"][
         "custom_category_input"
     ]["value"]
-    [
-        thread_ts,
-        user_who_requested,
-        reported_at,
-        user_input,
-        selected_user,
-        channel_id,
-        response_ts,
-        ticket_category,
-    ] = view["private_metadata"].split("@@")
-    reflected_ts = ticket_manager.get_reflected_ts(thread_ts)
-    unique_id = ticket_manager.get_unique_id(thread_ts)
-    ticket_key_for_user = f"{user_who_requested}@@{response_ts}@@{truncate_value(user_input)}@@{reported_at}@@{selected_user}@@{custom_category}@@{ticket_category}"
+    payload = load_payload(view["private_metadata"], ())
+    thread_ts = payload.thread_ts
+    user_who_requested = payload.reporter
+    reported_at = payload.reported_at
+    user_input = payload.user_input
+    selected_user = payload.assignee
+    channel_id = payload.channel_id
+    ticket = ticket_manager.get_ticket(thread_ts)
+    reflected_ts = ticket.reflected_ts
+    unique_id = ticket.unique_id
+    ticket_key_for_user = ticket_manager.store_payload(
+        payload.copy(issue_category=custom_category)
+    )
 
     try:
         updated_blocks = [
@@ -2941,8 +3261,13 @@ def handle_custom_category_modal_submission(ack, body, client, view, logger):
             },
         ]
 
+        ticket = ticket_manager.update(thread_ts, issue_category=custom_category)
         client.chat_update(
-            channel=channel_id, ts=thread_ts, text=None, blocks=updated_blocks
+            channel=channel_id,
+            ts=thread_ts,
+            text=None,
+            blocks=updated_blocks,
+            metadata=metadata_for(ticket, ticket_key_for_user),
         )
 
         client.chat_update(
@@ -2964,13 +3289,40 @@ def handle_custom_category_modal_submission(ack, body, client, view, logger):
 @app.action("helpdesk_resolve_post_chatting")
 def resolve_button_post_chatting(ack, body, client, logger):
     ack()
+    message_ts = body["container"]["message_ts"]
     user_id = body["user"]["id"]
-    [ticket_id, user_reported, user_ts, conv_id, support_id, staff_ts, start_ts] = body[
-        "actions"
-    ][0]["value"].split("@@")
+    payload = load_payload(
+        body["actions"][0]["value"],
+        (
+            "ticket_id",
+            "reporter",
+            "reporter_ts",
+            "conversation_id",
+            "support_id",
+            "staff_ts",
+            "chat_started_ts",
+        ),
+    )
+    ticket_id = payload.ticket_id
+    user_reported = payload.reporter
+    user_ts = payload.reporter_ts
+    conv_id = payload.conversation_id
+    support_id = payload.support_id
+    staff_ts = payload.staff_ts
+    start_ts = payload.chat_started_ts
     timestamp_utc = datetime.now(timezone.utc)
     timestamp_jakarta = convert_utc_to_jakarta(timestamp_utc)
-
+    if not ticket_id or not conv_id:
+        logger.error(f"Ticket {message_ts} has no payload, ignoring resolve")
+        return
+    previous_status = ticket_manager.get_ticket_status(message_ts)
+    ticket = ticket_manager.transition(message_ts, OPEN_STATUSES, "resolved")
+    if ticket is None:
+        logger.info(f"Ticket {message_ts} is already closed, ignoring resolve")
+        return
+    escalator.cancel(message_ts)
+
+    shown = False
     try:
         messages = get_chat_history(client, conv_id, float(start_ts))
 
@@ -2989,7 +3341,14 @@ def resolve_button_post_chatting(ack, body, client, logger):
         )
         blocks.pop(2)
 
-        client.chat_update(channel=helpdesk_cn, ts=staff_ts, text=None, blocks=blocks)
+        client.chat_update(
+            channel=helpdesk_cn,
+            ts=staff_ts,
+            text=None,
+            blocks=blocks,
+            metadata=metadata_for(ticket),
+        )
+        shown = True
 
         client.chat_postMessage(
             channel=user_reported,
@@ -3008,6 +3367,8 @@ def resolve_button_post_chatting(ack, body, client, logger):
         logger.info(f"Ticket {ticket_id} resolved successfully.")
     except Exception as e:
         logging.error(f"Error resolving post chatting: {str(e)}")
+        if not shown:
+            release_ticket(message_ts, "resolved", previous_status)
 
 
 @app.action("helpdesk_resolve")
@@ -3015,37 +3376,44 @@ def resolve_button_post_chatting(ack, body, client, logger):
 @app.action("resolve_button")
 def resolve_button(ack, body, client, logger):
     ack()
+    ticket = None
+    shown = False
     try:
+        thread_ts = body["container"]["message_ts"]
+        conditional_index = 2 if len(body["message"]["blocks"]) <= 3 else 4
+        elements = body["message"]["blocks"][conditional_index]["elements"]
+        payload = load_payload(elements[0]["value"])
+        category_ticket = payload.category
+        if category_ticket not in TICKET_CATEGORIES:
+            logger.error(f"Ticket {thread_ts} has no payload, ignoring resolve")
+            return
+        previous_status = ticket_manager.get_ticket_status(thread_ts)
+        ticket = ticket_manager.transition(thread_ts, OPEN_STATUSES, "resolved")
+        if ticket is None:
+            logger.info(f"Ticket {thread_ts} is already closed, ignoring resolve")
+            return
+        escalator.cancel(thread_ts)
         user_id = body["user"]["id"]
         user_info = client.users_info(user=user_id)
         user_name = user_info["user"]["real_name"]
         channel_id = body["channel"]["id"]
-        thread_ts = body["container"]["message_ts"]
-        reflected_ts = ticket_manager.get_reflected_ts(thread_ts)
-        conditional_index = 2 if len(body["message"]["blocks"]) <= 3 else 4
-        elements = body["message"]["blocks"][conditional_index]["elements"]
-        resolve_button_value = elements[0]["value"].split("@@")
-        category_ticket = resolve_button_value[-1]
+        reflected_ts = ticket.reflected_ts
         timestamp_utc = datetime.now(timezone.utc)
         timestamp_jakarta = convert_utc_to_jakarta(timestamp_utc)
 
         if category_ticket == "Piket":
-            [
-                reporter_piket,
-                response_ts,
-                timestamp,
-                date,
-                teacher_requested,
-                teacher_replace,
-                grade,
-                slot_name,
-                time_class,
-                reason,
-                direct_lead,
-                stem_lead,
-            ] = resolve_button_value[:-1]
-            ticket_manager.update_ticket_status(thread_ts, "assigned")
-            unique_id = ticket_manager.get_unique_id(thread_ts)
+            reporter_piket = payload.reporter
+            response_ts = payload.reporter_ts
+            date = payload.class_date
+            teacher_requested = payload.teacher_requested
+            teacher_replace = payload.teacher_replace
+            grade = payload.grade
+            slot_name = payload.slot_name
+            time_class = payload.time_class
+            reason = payload.reason
+            direct_lead = payload.direct_lead
+            stem_lead = payload.stem_lead
+            unique_id = ticket.unique_id
             teacher_replace_state = (
                 f"<@{teacher_replace}>"
                 if teacher_replace != "No Mentor"
@@ -3107,8 +3475,13 @@ def resolve_button(ack, body, client, logger):
                 },
             ]
             response = client.chat_update(
-                channel=channel_id, ts=thread_ts, text=None, blocks=piket_message
+                channel=channel_id,
+                ts=thread_ts,
+                text=None,
+                blocks=piket_message,
+                metadata=metadata_for(ticket),
             )
+            shown = True
             if response["ok"]:
                 client.chat_postMessage(
                     channel=channel_id,
@@ -3136,9 +3509,10 @@ def resolve_button(ack, body, client, logger):
                 },
             )
         elif category_ticket == "Emergency":
-            reflected_ts = ticket_manager.get_reflected_ts(thread_ts)
-            user_who_requested_ticket_id = resolve_button_value[0]
-            user_message_ts = resolve_button_value[1]
+            user_who_requested_ticket_id = payload.reporter
+            user_message_ts = payload.reporter_ts
+            # Alerts posted before IDs were generated are keyed by message ts.
+            emergency_id = payload.ticket_id or f"emergency-{user_message_ts}"
             emergency_reflected_ts = ticket_manager.get_reflected_ts(user_message_ts)
             resolved_emergency_block = [
                 {
@@ -3185,7 +3559,9 @@ def resolve_button(ack, body, client, logger):
                 ts=thread_ts,
                 text="Emergency resolved. Details updated in the thread.",
                 blocks=resolved_emergency_block,
+                metadata=metadata_for(ticket),
             )
+            shown = True
 
             if resolved_response["ok"]:
                 client.reactions_add(
@@ -3207,7 +3583,7 @@ def resolve_button(ack, body, client, logger):
                 )
 
                 sheet_manager.update_emergency_row(
-                    f"emergency-{user_message_ts}",
+                    emergency_id,
                     {
                         "resolved_by": get_real_name(client, user_id),
                         "resolved_at": timestamp_utc,
@@ -3215,7 +3591,9 @@ def resolve_button(ack, body, client, logger):
                 )
 
         elif category_ticket == "IT Helpdesk":
-            [ticket_id, user_reported, user_ts] = resolve_button_value[0:3]
+            ticket_id = payload.ticket_id
+            user_reported = payload.reporter
+            user_ts = payload.reporter_ts
             blocks = body["message"]["blocks"]
             blocks[1]["fields"][7]["text"] = "*Status:*\n:white_check_mark: Resolved"
             blocks[1]["fields"].append(
@@ -3224,8 +3602,13 @@ def resolve_button(ack, body, client, logger):
             blocks.pop(2)
 
             client.chat_update(
-                channel=channel_id, ts=thread_ts, text=None, blocks=blocks
+                channel=channel_id,
+                ts=thread_ts,
+                text=None,
+                blocks=blocks,
+                metadata=metadata_for(ticket),
             )
+            shown = True
 
             client.chat_postMessage(
                 channel=user_reported,
@@ -3242,18 +3625,18 @@ def resolve_button(ack, body, client, logger):
             )
 
         elif category_ticket == "Others":
-            user_who_requested_ticket_id = resolve_button_value[0]
-            user_message_ts = resolve_button_value[1]
-            user_input = resolve_button_value[2]
-            ticket_reported_at = resolve_button_value[3]
-            selected_user = resolve_button_value[4]
-            selected_category = resolve_button_value[5]
-            category_ticket = resolve_button_value[6]
-            unique_id = ticket_manager.get_unique_id(thread_ts)
+            user_who_requested_ticket_id = payload.reporter
+            user_message_ts = payload.reporter_ts
+            user_input = payload.user_input
+            ticket_reported_at = payload.reported_at
+            selected_user = payload.assignee
+            selected_category = payload.issue_category
+            unique_id = ticket.unique_id
             response = client.chat_update(
                 channel=channel_id,
                 ts=thread_ts,
                 text=None,
+                metadata=metadata_for(ticket),
                 blocks=[
                     {
                         "type": "section",
@@ -3297,6 +3680,7 @@ def resolve_button(ack, body, client, logger):
                     },
                 ],
             )
+            shown = True
             sheet_manager.update_ticket(
                 f"live-ops.{unique_id}",
                 {"resolved_by": user_name, "resolved_at": timestamp_utc},
@@ -3375,6 +3759,10 @@ def resolve_button(ack, body, client, logger):
                 logging.error(f"Failed to post message: {response['error']}")
     except Exception as e:
         logger.error(f"Error resolve function: {str(e)}")
+        # Once the resolved message is shown, its buttons are gone; the
+        # ticket stays resolved rather than reopen with nothing to click.
+        if ticket is not None and not shown:
+            release_ticket(thread_ts, "resolved", previous_status)
 
 
 @app.action("helpdesk_reject")
@@ -3383,23 +3771,14 @@ def handle_reject_button(ack, body, client):
     ack()
     trigger_id = body["trigger_id"]
     message_ts = body["container"]["message_ts"]
-    unique_id = ticket_manager.get_unique_id(message_ts)
+    if ticket_manager.get_ticket_status(message_ts) in CLOSED_STATUSES:
+        logging.info(f"Ticket {message_ts} is already closed, not opening reject")
+        return
     channel_id = body["channel"]["id"]
-    user_info = client.users_info(user=body["user"]["id"])
-    user_name = user_info["user"]["real_name"]
     blocks = body["message"]["blocks"]
     conditional_index = conditional_indexing(blocks)
     elements = blocks[conditional_index[0]]["elements"]
-    reject_button_value = elements[conditional_index[1]]["value"]
-    timestamp_utc = datetime.now(timezone.utc)
-    sheet_manager.update_ticket(
-        f"live-ops.{unique_id}",
-        {"rejected_by": user_name, "rejected_at": timestamp_utc},
-    )
-    sheet_manager.update_piket(
-        f"piket.{unique_id}",
-        {"status": "Rejected", "rejected_by": user_name, "rejected_at": timestamp_utc},
-    )
+    payload = load_payload(elements[conditional_index[1]]["value"])
     modal = {
         "type": "modal",
         "callback_id": "modal_reject",
@@ -3418,7 +3797,9 @@ def handle_reject_button(ack, body, client):
                 },
             },
         ],
-        "private_metadata": f"{channel_id}@@{message_ts}@@{reject_button_value}",
+        "private_metadata": ticket_manager.store_payload(
+            payload.copy(channel_id=channel_id, thread_ts=message_ts)
+        ),
     }
 
     try:
@@ -3430,36 +3811,53 @@ def handle_reject_button(ack, body, client):
 @app.view("modal_reject")
 def show_reject_modal(ack, body, client, view, logger, say):
     ack()
+    ticket = None
+    shown = False
     try:
         user_id = body["user"]["id"]
-        [channel_id, message_ts, *reject_button_value] = view["private_metadata"].split(
-            "@@"
-        )
-        reflected_ts = ticket_manager.get_reflected_ts(message_ts)
-        unique_id = ticket_manager.get_unique_id(message_ts)
+        payload = load_payload(view["private_metadata"], ())
+        channel_id = payload.channel_id
+        message_ts = payload.thread_ts
         reason = view["state"]["values"]["reject_reason"]["reason_input"]["value"]
+        if not message_ts or payload.category not in TICKET_CATEGORIES:
+            logger.error(f"Reject of {message_ts} has no payload, ignoring it")
+            return
+        previous_status = ticket_manager.get_ticket_status(message_ts)
+        ticket = ticket_manager.transition(message_ts, OPEN_STATUSES, "rejected")
+        if ticket is None:
+            logger.info(f"Ticket {message_ts} is already closed, ignoring reject")
+            return
+        escalator.cancel(message_ts)
+        reflected_ts = ticket.reflected_ts
+        unique_id = ticket.unique_id
         timestamp_utc = datetime.now(timezone.utc)
         timestamp_jakarta = convert_utc_to_jakarta(timestamp_utc)
-        ticket_category = reject_button_value[-1]
-        ticket_manager.update_ticket_status(message_ts, "assigned")
+        ticket_category = payload.category
 
         if ticket_category == "Others":
-            [
-                user_requested_id,
-                user_message_ts,
-                user_input,
-                ticket_reported_at,
-            ] = reject_button_value[0:4]
+            sheet_manager.update_ticket(
+                f"live-ops.{unique_id}",
+                {
+                    "rejected_by": get_real_name(client, user_id),
+                    "rejected_at": timestamp_utc,
+                },
+            )
+            user_requested_id = payload.reporter
+            user_message_ts = payload.reporter_ts
+            user_input = payload.user_input
+            ticket_reported_at = payload.reported_at
             response = client.chat_postMessage(
                 channel=channel_id,
                 thread_ts=message_ts,
                 text=f"<@{user_id}> has rejected the issue at `{timestamp_jakarta}` due to: ```{reason}```",
             )
+            shown = True
             if response["ok"]:
                 client.chat_update(
                     channel=channel_id,
                     ts=message_ts,
                     text=None,
+                    metadata=metadata_for(ticket),
                     blocks=[
                         {
                             "type": "section",
@@ -3558,20 +3956,19 @@ def show_reject_modal(ack, body, client, view, logger, say):
                 logger.error("No value information available for this channel.")
         elif ticket_category == "IT Helpdesk":
             helpdesk_rejection_text = f"<@{user_id}> has rejected the helpdesk request at `{timestamp_jakarta}` due to: ```{reason}```"
-            [
-                ticket_id,
-                helpdesk_reporter,
-                reporter_ts,
-                full_name,
-                timestamp_jakarta,
-                issue_type,
-                issue_desc,
-                urgency_level,
-                incident_time,
-            ] = reject_button_value[:-1]
+            ticket_id = payload.ticket_id
+            helpdesk_reporter = payload.reporter
+            reporter_ts = payload.reporter_ts
+            full_name = payload.full_name
+            timestamp_jakarta = payload.reported_at
+            issue_type = payload.issue_type
+            issue_desc = payload.user_input
+            urgency_level = payload.urgency_level
+            incident_time = payload.incident_at
             helpdesk_user_response = client.chat_postMessage(
                 channel=channel_id, thread_ts=message_ts, text=helpdesk_rejection_text
             )
+            shown = True
             if helpdesk_user_response["ok"]:
                 helpdesk_ticket_blocks = [
                     {
@@ -3616,6 +4013,7 @@ def show_reject_modal(ack, body, client, view, logger, say):
                     ts=message_ts,
                     text="Sorry, We reject this helpdesk request.",
                     blocks=helpdesk_ticket_blocks,
+                    metadata=metadata_for(ticket),
                 )
 
                 client.chat_postMessage(
@@ -3636,26 +4034,32 @@ def show_reject_modal(ack, body, client, view, logger, say):
                 )
 
         elif ticket_category == "Piket":
-            [
-                reporter_piket,
-                response_ts,
-                timestamp,
-                date,
-                teacher_requested,
-                teacher_replace,
-                grade,
-                slot_name,
-                time_class,
-                reason_on_piket_replacement,
-                direct_lead,
-                stem_lead,
-            ] = reject_button_value[:-1]
+            reporter_piket = payload.reporter
+            response_ts = payload.reporter_ts
+            date = payload.class_date
+            teacher_requested = payload.teacher_requested
+            teacher_replace = payload.teacher_replace
+            grade = payload.grade
+            slot_name = payload.slot_name
+            time_class = payload.time_class
+            reason_on_piket_replacement = payload.reason
+            direct_lead = payload.direct_lead
+            stem_lead = payload.stem_lead
+            sheet_manager.update_piket(
+                f"piket.{unique_id}",
+                {
+                    "status": "Rejected",
+                    "rejected_by": get_real_name(client, user_id),
+                    "rejected_at": timestamp_utc,
+                },
+            )
             general_rejection_text = f"<@{user_id}> has rejected the request at `{timestamp_jakarta}` due to: ```{reason}```"
             response = client.chat_postMessage(
                 channel=channel_id,
                 thread_ts=message_ts,
                 text=general_rejection_text,
             )
+            shown = True
             teacher_replace_state = (
                 f"<@{teacher_replace}>"
                 if teacher_replace != "No Mentor"
@@ -3721,7 +4125,11 @@ def show_reject_modal(ack, body, client, view, logger, say):
                     },
                 ]
                 client.chat_update(
-                    channel=channel_id, ts=message_ts, text=None, blocks=piket_message
+                    channel=channel_id,
+                    ts=message_ts,
+                    text=None,
+                    blocks=piket_message,
+                    metadata=metadata_for(ticket),
                 )
 
                 client.chat_postMessage(
@@ -3746,7 +4154,36 @@ def show_reject_modal(ack, body, client, view, logger, say):
                 logger.error("No value information available for this channel.")
     except Exception as e:
         logger.error(f"Error handling modal submission: {str(e)}")
+        # Once the rejection is shown, the ticket stays rejected.
+        if ticket is not None and not shown:
+            release_ticket(message_ts, "rejected", previous_status)
+
+
+def restore_tickets():
+    """Recovers the tickets lost with the local state, then resumes their
+    escalations. Runs once the socket is connected, so events are handled
+    while it reads the channel history."""
+    try:
+        if recovery_due(ticket_manager):
+            recover_tickets(
+                app.client,
+                ticket_manager,
+                [ops_cn, helpdesk_cn, reflected_cn, emergency_reflected_cn],
+            )
+        escalator.restore(app.client)
+    except Exception as e:
+        logging.error(f"Error restoring tickets: {str(e)}")
 
 
 if __name__ == "__main__":
-    SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start()
+    sheet_manager.start_warm_up()
+    sheet_manager.start_archiving()
+    reminder_scheduler.start()
+    memory_monitor.start_logging()
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, memory_monitor.handle_signal)
+    handler = SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
+    handler.connect()
+    threading.Thread(target=restore_tickets, name="ticket-restore", daemon=True).start()
+    # What SocketModeHandler.start() does after connecting.
+    threading.Event().wait()
@@ -0,0 +1,232 @@
+"""Offline benchmark for SheetManager.
+
+Drives the storage calls each Slack lifecycle makes (Others, Piket, Emergency
+and IT Helpdesk) against the in-process fake from fake_sheets.py, and reports
+Sheets API calls, bytes and wall time so storage regressions show up before
+they reach the real spreadsheet.
+
+    python benchmark.py --rows 100000 --tickets 50 --latency 0.05
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import database
+from database import SheetManager, SheetsQuota, new_ticket_id
+from fake_sheets import FakeClient, build_spreadsheet
+
+
+def others_lifecycle(manager, unique_id):
+    ticket_id = f"live-ops.{unique_id}"
+    manager.init_ticket_row(
+        ticket_id, "U0001", "Reporter", "Zoom link is broken", datetime.utcnow()
+    )
+    yield
+    manager.update_ticket(
+        ticket_id,
+        {
+            "handled_by": "Staff",
+            "handled_at": datetime.utcnow(),
+            "assigned_by": "Lead",
+        },
+    )
+    yield
+    manager.update_ticket(ticket_id, {"category_issue": "Zoom"})
+    yield
+    manager.update_ticket(
+        ticket_id, {"resolved_by": "Staff", "resolved_at": datetime.utcnow()}
+    )
+
+
+def piket_lifecycle(manager, unique_id):
+    piket_id = f"piket.{unique_id}"
+    slots = manager.get_slots_by_grade("7")
+    manager.init_piket_row(
+        piket_id,
+        "Teacher",
+        "Mentor",
+        "7",
+        slots[0] if slots else "",
+        "2024-01-01",
+        "08:00",
+        "Sick leave",
+        "Direct Lead",
+        "STEM Lead",
+        datetime.utcnow(),
+    )
+    yield
+    manager.update_piket(
+        piket_id,
+        {
+            "status": "Approved",
+            "approved_by": "Staff",
+            "approved_at": datetime.utcnow(),
+        },
+    )
+
+
+def emergency_lifecycle(manager, unique_id):
+    emergency_id = f"emergency-{unique_id}"
+    manager.init_emergency(emergency_id, "Teacher", datetime.utcnow())
+    yield
+    manager.update_emergency_row(
+        emergency_id, {"resolved_by": "Staff", "resolved_at": datetime.utcnow()}
+    )
+
+
+def helpdesk_lifecycle(manager, unique_id):
+    ticket_id = f"it-helpdesk.{unique_id}"
+    manager.init_it_helpdesk(
+        ticket_id,
+        "Staff",
+        "laptop issue",
+        "Laptop does not boot",
+        "High",
+        "2024-01-01 08:00",
+        "[]",
+        datetime.utcnow(),
+    )
+    yield
+    manager.update_helpdesk(ticket_id, {"history_chat": "Support: on it"})
+    yield
+    manager.update_helpdesk(
+        ticket_id, {"resolved_by": "Support", "resolved_at": "2024-01-01 09:00:00"}
+    )
+
+
+FINISHED = object()
+
+LIFECYCLES = {
+    "Others": others_lifecycle,
+    "Piket": piket_lifecycle,
+    "Emergency": emergency_lifecycle,
+    "IT Helpdesk": helpdesk_lifecycle,
+}
+
+
+def drain(manager, attempts=10):
+    for _ in range(attempts):
+        if manager.sheets.write_queue.flush():
+            return True
+    return False
+
+
+def measure(client, func, *args):
+    client.stats.reset()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    snapshot = client.stats.snapshot()
+    snapshot["seconds"] = elapsed
+    return snapshot, result
+
+
+def run_lifecycle(manager, lifecycle, tickets):
+    """Runs `tickets` lifecycles, flushing the sheet queue after every step.
+
+    Flushing per step matches a quiet bot, where each handler's write is
+    flushed on its own before the next interaction arrives. Returns the time
+    spent inside the storage calls the handlers make.
+    """
+    handler_seconds = 0
+    for _ in range(tickets):
+        steps = lifecycle(manager, new_ticket_id())
+        while True:
+            started = time.perf_counter()
+            finished = next(steps, FINISHED) is FINISHED
+            handler_seconds += time.perf_counter() - started
+            drain(manager)
+            if finished:
+                break
+    return handler_seconds
+
+
+def build_manager(args, client, workdir):
+    manager = SheetManager(
+        {},
+        "benchmark",
+        db_path=os.path.join(workdir, "benchmark.db"),
+        spool_path=os.path.join(workdir, "benchmark_spool.jsonl"),
+        primary=args.primary,
+        client=client,
+    )
+    if not args.quota:
+        unlimited = 10**9
+        manager.sheets.quota = SheetsQuota(unlimited, unlimited, unlimited)
+    return manager
+
+
+def run(args):
+    database.SHEETS_BACKOFF_BASE = args.backoff_base
+    client = FakeClient(latency=0, error_rate=0, seed=args.seed)
+    build_spreadsheet(client, "benchmark", rows=args.rows, legacy_ids=args.legacy_ids)
+    client.latency = args.latency
+    client.error_rate = args.error_rate
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        manager = build_manager(args, client, workdir)
+        results["warm-up"], _ = measure(client, manager.warm_up)
+        for name, lifecycle in LIFECYCLES.items():
+            results[name], handler_seconds = measure(
+                client, run_lifecycle, manager, lifecycle, args.tickets
+            )
+            results[name]["handler_seconds"] = handler_seconds
+        results["pending_sheet_writes"] = len(manager.sheets.write_queue.pending)
+        results["quota"] = manager.sheets.quota.stats()
+    return results
+
+
+def print_report(args, results):
+    print(
+        f"rows={args.rows} tickets={args.tickets} latency={args.latency}s "
+        f"error_rate={args.error_rate} primary={args.primary}"
+    )
+    print(
+        f"{'lifecycle':<12} {'calls':>7} {'calls/tkt':>9} {'KB':>10} "
+        f"{'KB/tkt':>8} {'wall s':>8} {'handler ms/tkt':>14} {'errors':>6}"
+    )
+    for name in ["warm-up"] + list(LIFECYCLES):
+        result = results[name]
+        tickets = args.tickets if name in LIFECYCLES else 1
+        kilobytes = result["bytes"] / 1024
+        print(
+            f"{name:<12} {result['calls']:>7} {result['calls'] / tickets:>9.1f} "
+            f"{kilobytes:>10.1f} {kilobytes / tickets:>8.1f} "
+            f"{result['seconds']:>8.2f} "
+            f"{result.get('handler_seconds', 0) * 1000 / tickets:>14.2f} "
+            f"{result['errors']:>6}"
+        )
+    print(f"pending sheet writes: {results['pending_sheet_writes']}")
+    print(f"quota counters: {results['quota']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--tickets", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--backoff-base", type=float, default=0.01)
+    parser.add_argument("--primary", choices=["sqlite", "sheets"], default="sqlite")
+    parser.add_argument("--quota", action="store_true")
+    parser.add_argument("--legacy-ids", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(args, results)
+
+
+if __name__ == "__main__":
+    main()
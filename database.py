@@ -1,57 +1,349 @@
 import gspread
 import logging
 from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import re
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
 
+# A lookup miss only re-reads the ID column if the cached index is older than
+# this, so repeated misses for IDs that really are absent stay cheap.
+INDEX_RELOAD_INTERVAL = 30
 
-class SheetManager:
-    def __init__(self, creds_dict, sheet_key):
+updated_range_pattern = re.compile(r"[A-Z]+(\d+)(?::[A-Z]+(\d+))?$")
+
+STORAGE_DB_PATH = os.getenv("STORAGE_DB_PATH", "live_ops.db")
+STORAGE_PRIMARY = os.getenv("STORAGE_PRIMARY", "sqlite")
+SHEET_SPOOL_PATH = os.getenv("SHEET_SPOOL_PATH", "sheet_spool.jsonl")
+FLUSH_INTERVAL = 2
+MAX_FLUSH_BACKOFF = 60
+WARM_UP_ATTEMPTS = 5
+SLOT_CATALOG_TTL = 600
+
+# Google Sheets allows 60 read and 60 write requests per minute per user.
+SHEETS_READS_PER_MINUTE = int(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+SHEETS_WRITES_PER_MINUTE = int(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+SHEETS_BURST = 10
+SHEETS_MAX_RETRIES = 5
+SHEETS_BACKOFF_BASE = 1
+SHEETS_BACKOFF_MAX = 32
+
+# Closed rows older than this are moved out of the hot worksheets into
+# per-month archive worksheets. 0 turns rotation off.
+ARCHIVE_AFTER_DAYS = int(os.getenv("SHEETS_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL = 24 * 60 * 60
+# Deploys restart the bot far more often than once a day, so the first
+# rotation runs shortly after startup, once warm-up has had its reads.
+ARCHIVE_STARTUP_DELAY = 5 * 60
+# With shared ticket state, other instances write and rotate the same sheets,
+# so cached row numbers are checked against the sheet before writing.
+VERIFY_ROWS = os.getenv("TICKET_STATE_MODE", "local") == "shared"
+
+slot_number_pattern = re.compile(r"(\D+)\s(\d+)")
+
+# Ticket IDs are 10 Crockford base32 characters of Unix milliseconds followed
+# by 6 random ones, so they sort in creation order as plain strings.
+TICKET_ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+TICKET_ID_TIME_CHARS = 10
+TICKET_ID_RANDOM_CHARS = 6
+ticket_id_pattern = re.compile(r"[.-]([0-9A-HJKMNP-TV-Z]{16})$")
+
+# Row lookups by sortable ID bisect the ID column reading this many cells at a
+# time instead of downloading the whole column.
+ROW_BISECT_BLOCK = 200
+
+
+def slot_sorting_key(slot):
+    match = slot_number_pattern.search(slot)
+    if match:
+        subject = match.group(1).strip()
+        number = int(match.group(2))
+        return (subject, number)
+    else:
+        return (slot, 0)
+
+
+def encode_base32(value, length):
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(TICKET_ID_ALPHABET[remainder])
+    return "".join(reversed(chars))
+
+
+class TicketIdGenerator:
+    """Generates compact, time-ordered ticket IDs.
+
+    IDs created in the same millisecond increment the random part of the
+    previous one, so IDs from one process are strictly increasing even if
+    the clock stalls or steps back.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_ms = 0
+        self.last_random = 0
+
+    def new_id(self):
+        random_limit = 32**TICKET_ID_RANDOM_CHARS
+        with self.lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms <= self.last_ms:
+                now_ms = self.last_ms
+                self.last_random += 1
+                if self.last_random >= random_limit:
+                    now_ms += 1
+                    self.last_random = random.randrange(random_limit // 2)
+            else:
+                # Start in the lower half to leave room for increments.
+                self.last_random = random.randrange(random_limit // 2)
+            self.last_ms = now_ms
+            return encode_base32(now_ms, TICKET_ID_TIME_CHARS) + encode_base32(
+                self.last_random, TICKET_ID_RANDOM_CHARS
+            )
+
+
+ticket_ids = TicketIdGenerator()
+
+
+def new_ticket_id():
+    return ticket_ids.new_id()
+
+
+def ticket_id_sort_key(row_id):
+    """Orders an ID column: legacy IDs first, then sortable IDs, then blanks."""
+    if not row_id:
+        return (2, "")
+    match = ticket_id_pattern.search(row_id)
+    if not match:
+        return (0, "")
+    return (1, match.group(1))
+
+
+class SheetWriteQueue:
+    """Write-behind queue for spreadsheet writes.
+
+    Every queued write is appended to a local spool file before `put` returns,
+    and the spool is rewritten with whatever is still pending after each
+    flush, so a crash or restart replays unflushed writes (at least once).
+    """
+
+    def __init__(self, flush_handler, spool_path, flush_interval=FLUSH_INTERVAL):
+        self.flush_handler = flush_handler
+        self.spool_path = spool_path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.load_spool()
+        self.spool = open(self.spool_path, "a")
+        self.thread = threading.Thread(
+            target=self.run, name="sheet-write-queue", daemon=True
+        )
+        self.thread.start()
+
+    def load_spool(self):
+        if not os.path.exists(self.spool_path):
+            return
+        with open(self.spool_path) as f:
+            for line in f:
+                try:
+                    self.pending.append(json.loads(line))
+                except ValueError:
+                    logging.error(f"Skipping unreadable spool line: {line!r}")
+        if self.pending:
+            logging.info(f"Replaying {len(self.pending)} spooled sheet writes")
+
+    def put(self, op):
+        line = json.dumps(op, default=str)
+        with self.lock:
+            self.spool.write(line + "\n")
+            self.spool.flush()
+            os.fsync(self.spool.fileno())
+            self.pending.append(json.loads(line))
+
+    def rewrite_spool(self):
+        tmp_path = f"{self.spool_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for op in self.pending:
+                f.write(json.dumps(op, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.spool.close()
+        os.replace(tmp_path, self.spool_path)
+        self.spool = open(self.spool_path, "a")
+
+    def flush(self):
+        with self.lock:
+            ops, self.pending = self.pending, []
+        if not ops:
+            return True
         try:
-            scope = [
-                "https://spreadsheets.google.com/feeds",
-                "https://www.googleapis.com/auth/spreadsheets",
-                "https://www.googleapis.com/auth/drive.file",
-                "https://www.googleapis.com/auth/drive",
-            ]
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-            client = gspread.authorize(creds)
-            self.chat_sheet = client.open_by_key(sheet_key).worksheet("chit_chat")
-            self.ticket_sheet = client.open_by_key(sheet_key).worksheet("ticket")
-            self.piket_sheet = client.open_by_key(sheet_key).worksheet("piket")
-            self.slot_data = client.open_by_key(sheet_key).worksheet("slot_data")
-            self.emergency = client.open_by_key(sheet_key).worksheet("emergency")
-            self.it_helpdesk = client.open_by_key(sheet_key).worksheet("it_helpdesk")
+            failed = self.flush_handler(ops)
         except Exception as e:
-            logging.error(f"Failed to initialize SheetManager: {str(e)}")
+            logging.error(f"Failed to flush sheet writes: {str(e)}")
+            failed = ops
+        with self.lock:
+            # Failed writes go back in front so later writes never overtake them.
+            self.pending = failed + self.pending
+            self.rewrite_spool()
+        return not failed
 
-    def get_slots_by_grade(self, grade):
-        try:
-            grade_values = self.slot_data.col_values(1)
-            slot_values = self.slot_data.col_values(3)
+    def run(self):
+        delay = self.flush_interval
+        while True:
+            time.sleep(delay)
+            if self.flush():
+                delay = self.flush_interval
+            else:
+                delay = min(delay * 2, MAX_FLUSH_BACKOFF)
 
-            slots_for_grade = [
-                slot_values[i] for i, g in enumerate(grade_values) if g == str(grade)
-            ]
 
-            # Define a sorting key function
-            def sorting_key(slot):
-                match = re.search(r"(\D+)\s(\d+)", slot)
-                if match:
-                    subject = match.group(1).strip()
-                    number = int(match.group(2))
-                    return (subject, number)
-                else:
-                    return (slot, 0)
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
 
-            sorted_slots = sorted(slots_for_grade, key=sorting_key)
+    def acquire(self):
+        """Take one token, sleeping until one is available.
 
-            return sorted_slots
+        Returns True if the caller had to wait.
+        """
+        waited = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            waited = True
+            time.sleep(wait)
+
+
+class SheetsQuota:
+    """Rate limits and retries every Google Sheets call made by the bot.
+
+    Reads and writes draw from separate token buckets sized for the per-user
+    quotas. 429 and 5xx responses are retried with exponential backoff and
+    full jitter.
+    """
+
+    def __init__(
+        self,
+        reads_per_minute=SHEETS_READS_PER_MINUTE,
+        writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+        burst=SHEETS_BURST,
+        max_retries=SHEETS_MAX_RETRIES,
+    ):
+        self.buckets = {
+            "read": TokenBucket(reads_per_minute, burst),
+            "write": TokenBucket(writes_per_minute, burst),
+        }
+        self.max_retries = max_retries
+        self.counters = {"calls": 0, "throttled": 0, "retried": 0, "failed": 0}
+        self.counters_lock = threading.Lock()
+
+    def count(self, name):
+        with self.counters_lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.counters_lock:
+            return dict(self.counters)
+
+    def is_retryable(self, error):
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        return status == 429 or (status is not None and status >= 500)
+
+    def call(self, kind, func, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            if self.buckets[kind].acquire():
+                self.count("throttled")
+            self.count("calls")
+            try:
+                return func(*args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                if not self.is_retryable(e) or attempt == self.max_retries:
+                    self.count("failed")
+                    raise
+                self.count("retried")
+                backoff = min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2**attempt)
+                delay = random.uniform(0, backoff)
+                logging.warning(
+                    f"Sheets {kind} call failed ({str(e)}), retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+            except Exception:
+                self.count("failed")
+                raise
+
+    def read(self, func, *args, **kwargs):
+        return self.call("read", func, *args, **kwargs)
+
+    def write(self, func, *args, **kwargs):
+        return self.call("write", func, *args, **kwargs)
 
-        except Exception as e:
-            logging.error(f"Failed to fetch slots for grade {grade}: {str(e)}")
-            return []
+
+class StorageBackend:
+    """Ticket storage API shared by every backend.
+
+    Backends only implement `append_record`, `update_record` and
+    `get_slots_by_grade`; rows are laid out the same way as the spreadsheet.
+    """
+
+    def append_record(self, name, row_id, values):
+        raise NotImplementedError
+
+    def update_record(self, name, row_id, updates):
+        raise NotImplementedError
+
+    def get_slots_by_grade(self, grade):
+        raise NotImplementedError
+
+    def serialize_updates(self, name, updates):
+        col_mapping = self.col_mapping_for(name)
+        serialized = {}
+        for key, value in updates.items():
+            if key not in col_mapping:
+                raise KeyError(key)
+            if "at" in key and isinstance(value, datetime):
+                value = self.convert_utc_to_jakarta(value)
+            serialized[key] = value
+        return serialized
+
+    def col_mapping_for(self, name):
+        return {
+            "chit_chat": self.chat_col_mapping,
+            "ticket": self.column_mappings,
+            "piket": self.piket_col_mapping,
+            "emergency": self.emergency_col_mapping,
+            "it_helpdesk": self.helpdesk_col_mapping,
+        }[name]
+
+    @property
+    def chat_col_mapping(self):
+        return {
+            "chat_timestamp": 1,
+            "timestamp": 2,
+            "user_id": 3,
+            "user_name": 4,
+            "email": 5,
+            "phone_number": 6,
+            "text": 7,
+        }
 
     def convert_utc_to_jakarta(self, time):
         utc_time = time.replace(tzinfo=pytz.utc)
@@ -80,7 +372,7 @@ class SheetManager:
                 phone_number,
                 text,
             ]
-            self.chat_sheet.append_row(data)
+            self.append_record("chit_chat", None, data)
         except Exception as e:
             logging.error(f"Failed to log chat: {str(e)}")
 
@@ -88,7 +380,7 @@ class SheetManager:
         try:
             timestamp_local = self.convert_utc_to_jakarta(timestamp_utc)
             data = [emergency_id, timestamp_local, user_requested]
-            self.emergency.append_row(data)
+            self.append_record("emergency", emergency_id, data)
         except Exception as e:
             logging.error(f"Failed to initialize emergency row: {str(e)}")
 
@@ -115,7 +407,7 @@ class SheetManager:
                 incident_date_time,
                 attachment_files,
             ]
-            self.it_helpdesk.append_row(data)
+            self.append_record("it_helpdesk", it_helpdesk_id, data)
         except Exception as e:
             logging.error(f"Failed to populate the data on it_helpdesk: {str(e)}")
 
@@ -148,7 +440,7 @@ class SheetManager:
                 direct_lead,
                 stem_lead,
             ]
-            self.piket_sheet.append_row(data)
+            self.append_record("piket", piket_id, data)
         except Exception as e:
             logging.error(f"Failed to initialize piket row: {str(e)}")
 
@@ -168,30 +460,18 @@ class SheetManager:
                 "",
                 "",
             ]
-            self.ticket_sheet.append_row(data)
+            self.append_record("ticket", ticket_id, data)
         except Exception as e:
             logging.error(f"Failed to initialize ticket row: {str(e)}")
 
     def update_ticket(self, ticket_id, updates):
         try:
-            row = self.find_ticket_row(ticket_id)
-            if row:
-                for key, value in updates.items():
-                    col = self.column_mappings[key]
-                    if "at" in key and isinstance(value, datetime):
-                        value = self.convert_utc_to_jakarta(value)
-                    self.ticket_sheet.update_cell(row, col, value)
+            self.update_record(
+                "ticket", ticket_id, self.serialize_updates("ticket", updates)
+            )
         except Exception as e:
             logging.error(f"Failed to update ticket: {str(e)}")
 
-    def find_ticket_row(self, ticket_id):
-        ticket_id_col = 2
-        col_values = self.ticket_sheet.col_values(ticket_id_col)
-        for i, val in enumerate(col_values):
-            if val == ticket_id:
-                return i + 1
-        return None
-
     @property
     def column_mappings(self):
         return {
@@ -214,24 +494,12 @@ class SheetManager:
 
     def update_piket(self, piket_id, updates):
         try:
-            row = self.find_piket_row(piket_id)
-            if row:
-                for key, value in updates.items():
-                    col = self.piket_col_mapping[key]
-                    if "at" in key and isinstance(value, datetime):
-                        value = self.convert_utc_to_jakarta(value)
-                    self.piket_sheet.update_cell(row, col, value)
+            self.update_record(
+                "piket", piket_id, self.serialize_updates("piket", updates)
+            )
         except Exception as e:
             logging.error(f"Failed to update ticket: {str(e)}")
 
-    def find_piket_row(self, piket_id):
-        piket_id_col = 1
-        col_values = self.piket_sheet.col_values(piket_id_col)
-        for i, val in enumerate(col_values):
-            if val == piket_id:
-                return i + 1
-        return None
-
     @property
     def piket_col_mapping(self):
         return {
@@ -256,24 +524,12 @@ class SheetManager:
 
     def update_emergency_row(self, emergency_id, updates):
         try:
-            row = self.find_emergency_id(emergency_id)
-            if row:
-                for key, value in updates.items():
-                    col = self.emergency_col_mapping[key]
-                    if "at" in key and isinstance(value, datetime):
-                        value = self.convert_utc_to_jakarta(value)
-                    self.emergency.update_cell(row, col, value)
+            self.update_record(
+                "emergency", emergency_id, self.serialize_updates("emergency", updates)
+            )
         except Exception as e:
             logging.error(f"Failed to update row: {str(e)}")
 
-    def find_emergency_id(self, emergency_id):
-        emergency_id_col = 1
-        col_values = self.emergency.col_values(emergency_id_col)
-        for i, val in enumerate(col_values):
-            if val == emergency_id:
-                return i + 1
-        return None
-
     @property
     def emergency_col_mapping(self):
         return {
@@ -286,24 +542,14 @@ class SheetManager:
 
     def update_helpdesk(self, it_helpdesk_id, updates):
         try:
-            row = self.find_it_helpdesk_id(it_helpdesk_id)
-            if row:
-                for key, value in updates.items():
-                    col = self.helpdesk_col_mapping[key]
-                    if "at" in key and isinstance(value, datetime):
-                        value = self.convert_utc_to_jakarta(value)
-                    self.it_helpdesk.update_cell(row, col, value)
+            self.update_record(
+                "it_helpdesk",
+                it_helpdesk_id,
+                self.serialize_updates("it_helpdesk", updates),
+            )
         except Exception as e:
             logging.error(f"Failed to update row: {str(e)}")
 
-    def find_it_helpdesk_id(self, it_helpdesk_id):
-        it_helpdesk_id_col = 1
-        col_values = self.it_helpdesk.col_values(it_helpdesk_id_col)
-        for i, val in enumerate(col_values):
-            if val == it_helpdesk_id:
-                return i + 1
-        return None
-
     @property
     def helpdesk_col_mapping(self):
         return {
@@ -322,3 +568,760 @@ class SheetManager:
             "rejection_reason": 13,
             "history_chat": 14,
         }
+
+
+class SheetsBackend(StorageBackend):
+    def __init__(
+        self,
+        creds_dict,
+        sheet_key,
+        spool_path,
+        on_slot_catalog=None,
+        client=None,
+        verify_rows=VERIFY_ROWS,
+    ):
+        self.quota = SheetsQuota()
+        self.client = client
+        self.verify_rows = verify_rows
+        self.creds_dict = creds_dict
+        self.sheet_key = sheet_key
+        self.worksheets = None
+        self.worksheets_lock = threading.Lock()
+        self.row_index = {}
+        self.row_index_loaded_at = {}
+        self.row_index_last_row = {}
+        self.row_index_lock = threading.Lock()
+        self.slot_catalog = None
+        self.slot_catalog_loaded_at = 0
+        self.slot_catalog_refreshing = False
+        self.slot_catalog_lock = threading.Lock()
+        self.on_slot_catalog = on_slot_catalog
+        self.archive_index = {}
+        self.archive_index_loaded_at = {}
+        self.sheet_write_lock = threading.Lock()
+        self.write_queue = SheetWriteQueue(self.flush_writes, spool_path)
+
+    def connect(self):
+        with self.worksheets_lock:
+            if self.worksheets is None and self.client is None:
+                scope = [
+                    "https://spreadsheets.google.com/feeds",
+                    "https://www.googleapis.com/auth/spreadsheets",
+                    "https://www.googleapis.com/auth/drive.file",
+                    "https://www.googleapis.com/auth/drive",
+                ]
+                creds = ServiceAccountCredentials.from_json_keyfile_dict(
+                    self.creds_dict, scope
+                )
+                self.client = gspread.authorize(creds)
+            if self.worksheets is None:
+                self.spreadsheet = self.quota.read(
+                    self.client.open_by_key, self.sheet_key
+                )
+                self.worksheets = {
+                    worksheet.title: worksheet
+                    for worksheet in self.quota.read(self.spreadsheet.worksheets)
+                }
+            return self.worksheets
+
+    def worksheet(self, title):
+        return self.connect()[title]
+
+    @property
+    def chat_sheet(self):
+        return self.worksheet("chit_chat")
+
+    @property
+    def ticket_sheet(self):
+        return self.worksheet("ticket")
+
+    @property
+    def piket_sheet(self):
+        return self.worksheet("piket")
+
+    @property
+    def slot_data(self):
+        return self.worksheet("slot_data")
+
+    @property
+    def emergency(self):
+        return self.worksheet("emergency")
+
+    @property
+    def it_helpdesk(self):
+        return self.worksheet("it_helpdesk")
+
+    def warm_up(self):
+        delay = 1
+        for attempt in range(1, WARM_UP_ATTEMPTS + 1):
+            try:
+                self.connect()
+                for name, id_col in self.id_columns.items():
+                    self.load_row_index(self.worksheet_for(name), id_col)
+                self.load_slot_catalog()
+                logging.info("Sheets backend warm-up finished")
+                return True
+            except Exception as e:
+                logging.error(
+                    f"Sheets backend warm-up attempt {attempt} failed: {str(e)}"
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_FLUSH_BACKOFF)
+        return False
+
+    def start_warm_up(self):
+        thread = threading.Thread(
+            target=self.warm_up, name="sheet-warm-up", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def parse_updated_rows(self, response):
+        try:
+            updated_range = response["updates"]["updatedRange"]
+        except (KeyError, TypeError):
+            return None
+        match = updated_range_pattern.search(updated_range.rsplit("!", 1)[-1])
+        if not match:
+            return None
+        first_row = int(match.group(1))
+        last_row = int(match.group(2) or first_row)
+        return range(first_row, last_row + 1)
+
+    def index_appended_rows(self, sheet, row_ids, response):
+        rows = self.parse_updated_rows(response)
+        with self.row_index_lock:
+            index = self.row_index.get(sheet.title)
+            if rows is None:
+                self.row_index.pop(sheet.title, None)
+                return
+            # Kept even without an index: bisect_row searches up to this row,
+            # since the worksheet's row_count is only its grid size when opened.
+            last_row = self.row_index_last_row.get(sheet.title, 0)
+            self.row_index_last_row[sheet.title] = max(last_row, rows[-1])
+            if index is None:
+                return
+            if len(rows) != len(row_ids):
+                self.row_index.pop(sheet.title, None)
+                return
+            if rows[0] <= last_row:
+                # Appends always land after the last row, so landing on a row
+                # we already know means rows were removed or moved by hand.
+                logging.info(f"Row index for {sheet.title} is stale, reloading")
+                self.row_index.pop(sheet.title, None)
+                return
+            for row_id, row in zip(row_ids, rows):
+                index.setdefault(row_id, row)
+
+    def load_row_index(self, sheet, id_col):
+        col_values = self.quota.read(sheet.col_values, id_col)
+        index = {}
+        for i, val in enumerate(col_values):
+            if val:
+                index.setdefault(val, i + 1)
+        with self.row_index_lock:
+            self.row_index[sheet.title] = index
+            self.row_index_loaded_at[sheet.title] = time.monotonic()
+            self.row_index_last_row[sheet.title] = len(col_values)
+        return index
+
+    def read_id_block(self, sheet, id_col, first_row, last_row):
+        cells = self.quota.read(
+            sheet.get,
+            f"{gspread.utils.rowcol_to_a1(first_row, id_col)}:"
+            f"{gspread.utils.rowcol_to_a1(last_row, id_col)}",
+        )
+        values = [row[0] if row else "" for row in cells]
+        return values + [""] * (last_row - first_row + 1 - len(values))
+
+    def bisect_row(self, sheet, id_col, row_id):
+        """Finds a row by binary search over blocks of the ID column.
+
+        Only works for time-ordered IDs, which are appended in order after any
+        legacy rows. Returns None when the row is not where the ordering says
+        it should be, so callers can fall back to a full read.
+        """
+        target = ticket_id_sort_key(row_id)
+        if target[0] != 1:
+            return None
+        with self.row_index_lock:
+            last_row = self.row_index_last_row.get(sheet.title, 0)
+        low, high = 2, max(sheet.row_count, last_row)
+        while low <= high:
+            first_row = low
+            if high - low + 1 > ROW_BISECT_BLOCK:
+                first_row = (low + high - ROW_BISECT_BLOCK) // 2
+            block_last_row = min(high, first_row + ROW_BISECT_BLOCK - 1)
+            values = self.read_id_block(sheet, id_col, first_row, block_last_row)
+            if row_id in values:
+                return first_row + values.index(row_id)
+            if target < ticket_id_sort_key(values[0]):
+                high = first_row - 1
+            elif target > ticket_id_sort_key(values[-1]):
+                low = block_last_row + 1
+            else:
+                return None
+        return None
+
+    def find_indexed_row(self, sheet, id_col, row_id):
+        with self.row_index_lock:
+            index = self.row_index.get(sheet.title)
+            loaded_at = self.row_index_loaded_at.get(sheet.title, 0)
+        if index is not None and row_id in index:
+            return index[row_id]
+        if index is not None and time.monotonic() - loaded_at < INDEX_RELOAD_INTERVAL:
+            return None
+        try:
+            row = self.bisect_row(sheet, id_col, row_id)
+        except Exception as e:
+            logging.error(f"Failed to bisect {sheet.title} for {row_id}: {str(e)}")
+            row = None
+        if row:
+            if index is not None:
+                with self.row_index_lock:
+                    index.setdefault(row_id, row)
+            return row
+        index = self.load_row_index(sheet, id_col)
+        return index.get(row_id)
+
+    def row_cell_ranges(self, row, col_mapping, updates):
+        return [
+            {
+                "range": gspread.utils.rowcol_to_a1(row, col_mapping[key]),
+                "values": [[value]],
+            }
+            for key, value in updates.items()
+        ]
+
+    def worksheet_for(self, name):
+        attribute = {
+            "chit_chat": "chat_sheet",
+            "ticket": "ticket_sheet",
+            "piket": "piket_sheet",
+            "emergency": "emergency",
+            "it_helpdesk": "it_helpdesk",
+        }[name]
+        return getattr(self, attribute)
+
+    @property
+    def id_columns(self):
+        return {"ticket": 2, "piket": 1, "emergency": 1, "it_helpdesk": 1}
+
+    def append_record(self, name, row_id, values):
+        self.write_queue.put(
+            {"op": "append", "sheet": name, "key": row_id, "values": values}
+        )
+
+    def update_record(self, name, row_id, updates):
+        self.write_queue.put(
+            {"op": "update", "sheet": name, "key": row_id, "updates": updates}
+        )
+
+    def flush_writes(self, ops):
+        with self.sheet_write_lock:
+            return self.flush_sheets(ops)
+
+    def flush_sheets(self, ops):
+        ops_by_sheet = {}
+        for op in ops:
+            ops_by_sheet.setdefault(op["sheet"], []).append(op)
+        failed = []
+        for name, sheet_ops in ops_by_sheet.items():
+            try:
+                failed.extend(self.flush_sheet_writes(name, sheet_ops))
+            except Exception as e:
+                logging.error(f"Failed to write to {name} sheet: {str(e)}")
+                failed.extend(sheet_ops)
+        return failed
+
+    def flush_sheet_writes(self, name, ops):
+        sheet = self.worksheet_for(name)
+        appends = [op for op in ops if op["op"] == "append"]
+        updates = [op for op in ops if op["op"] == "update"]
+
+        # Appends go first, so an update never overtakes the row it targets.
+        # If they fail, the updates stay queued behind them.
+        if appends:
+            try:
+                response = self.quota.write(
+                    sheet.append_rows, [op["values"] for op in appends]
+                )
+            except Exception as e:
+                logging.error(f"Failed to append rows to {name}: {str(e)}")
+                return ops
+            if name in self.id_columns:
+                self.index_appended_rows(sheet, [op["key"] for op in appends], response)
+
+        merged_updates = {}
+        for op in updates:
+            merged_updates.setdefault(op["key"], {}).update(op["updates"])
+
+        data_by_sheet = {}
+        try:
+            located_rows = self.locate_rows(name, merged_updates)
+            for row_id, row_updates in merged_updates.items():
+                located = located_rows.get(row_id)
+                if located:
+                    target, row = located
+                    data_by_sheet.setdefault(target.title, (target, []))[1].extend(
+                        self.row_cell_ranges(
+                            row, self.col_mapping_for(name), row_updates
+                        )
+                    )
+            for target, data in data_by_sheet.values():
+                self.quota.write(
+                    target.batch_update, data, value_input_option="USER_ENTERED"
+                )
+        except Exception as e:
+            logging.error(f"Failed to update rows on {name}: {str(e)}")
+            return updates
+        return []
+
+    def locate_row(self, name, row_id):
+        sheet = self.worksheet_for(name)
+        row = self.find_indexed_row(sheet, self.id_columns[name], row_id)
+        if row:
+            return sheet, row
+        archived = self.find_archived_row(name, row_id)
+        if archived:
+            title, row = archived
+            return self.worksheet(title), row
+        return None
+
+    def locate_rows(self, name, row_ids):
+        """Locates rows like locate_row. With `verify_rows`, also checks the
+        rows found in the hot worksheet still hold their IDs.
+
+        This instance's own rotations reset its index, but another instance's
+        rotation shifts rows under it. When any ID has moved, the index is
+        dropped and the moved IDs are looked up again from the sheet.
+        """
+        located = {row_id: self.locate_row(name, row_id) for row_id in row_ids}
+        if not self.verify_rows:
+            return located
+        sheet = self.worksheet_for(name)
+        id_col = self.id_columns[name]
+        hot = {
+            row_id: found[1]
+            for row_id, found in located.items()
+            if found and found[0].title == sheet.title
+        }
+        if not hot:
+            return located
+        cells = self.quota.read(
+            sheet.batch_get,
+            [gspread.utils.rowcol_to_a1(row, id_col) for row in hot.values()],
+        )
+        moved = [
+            row_id
+            for row_id, value in zip(hot, cells)
+            if (value[0][0] if value and value[0] else "") != row_id
+        ]
+        if moved:
+            logging.info(f"Row index for {sheet.title} is stale, reloading")
+            with self.row_index_lock:
+                self.row_index.pop(sheet.title, None)
+            self.archive_index.pop(name, None)
+            for row_id in moved:
+                located[row_id] = self.locate_row(name, row_id)
+        return located
+
+    def archive_title(self, name, period):
+        return f"{name}_archive_{period}"
+
+    def find_archived_row(self, name, row_id):
+        index = self.archive_index.get(name)
+        if index is not None and row_id in index:
+            return index[row_id]
+        loaded_at = self.archive_index_loaded_at.get(name, 0)
+        if index is None or time.monotonic() - loaded_at >= INDEX_RELOAD_INTERVAL:
+            # Other instances may have archived the row, into an archive
+            # worksheet this one has not seen yet.
+            worksheets = self.connect()
+            for worksheet in self.quota.read(self.spreadsheet.worksheets):
+                worksheets.setdefault(worksheet.title, worksheet)
+            index = {}
+            prefix = self.archive_title(name, "")
+            for title, archive in list(worksheets.items()):
+                if title.startswith(prefix):
+                    col_values = self.quota.read(
+                        archive.col_values, self.id_columns[name]
+                    )
+                    for i, val in enumerate(col_values):
+                        if val:
+                            index.setdefault(val, (title, i + 1))
+            self.archive_index[name] = index
+            self.archive_index_loaded_at[name] = time.monotonic()
+        return index.get(row_id)
+
+    @property
+    def closed_columns(self):
+        return {
+            "ticket": ["resolved_at", "rejected_at", "handed_over_at"],
+            "piket": ["approved_at", "rejected_at"],
+            "emergency": ["resolved_at"],
+            "it_helpdesk": ["resolved_at", "rejected_at"],
+        }
+
+    def archive_worksheet(self, name, period, header):
+        title = self.archive_title(name, period)
+        worksheets = self.connect()
+        if title not in worksheets:
+            archive = self.quota.write(
+                self.spreadsheet.add_worksheet,
+                title=title,
+                rows=1,
+                cols=len(header),
+            )
+            self.quota.write(archive.append_rows, [header])
+            worksheets[title] = archive
+        return worksheets[title]
+
+    def archive_closed_rows(self, name):
+        with self.sheet_write_lock:
+            return self.rotate_sheet(name)
+
+    def rotate_sheet(self, name):
+        sheet = self.worksheet_for(name)
+        col_mapping = self.col_mapping_for(name)
+        id_col = self.id_columns[name]
+        timestamp_col = col_mapping["timestamp"]
+        closed_cols = [col_mapping[key] for key in self.closed_columns[name]]
+        cutoff = self.convert_utc_to_jakarta(
+            datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        )
+
+        def cell(values, col):
+            return values[col - 1] if len(values) >= col else ""
+
+        rows = self.quota.read(sheet.get_all_values)
+        if len(rows) < 2:
+            return 0
+        header = rows[0]
+        archived_by_period = {}
+        for row_number, values in enumerate(rows[1:], start=2):
+            timestamp = cell(values, timestamp_col)
+            if not timestamp or timestamp >= cutoff:
+                continue
+            if not any(cell(values, col) for col in closed_cols):
+                continue
+            period = timestamp[:7]
+            archived_by_period.setdefault(period, []).append((row_number, values))
+        if not archived_by_period:
+            return 0
+
+        # Someone may have edited the sheet since it was read; only delete rows
+        # that still hold the IDs we are about to archive.
+        current_ids = self.quota.read(sheet.col_values, id_col)
+        for entries in archived_by_period.values():
+            for row_number, values in entries:
+                if cell(current_ids, row_number) != cell(values, id_col):
+                    logging.warning(f"{name} changed during rotation, skipping it")
+                    return 0
+
+        for period, entries in archived_by_period.items():
+            archive = self.archive_worksheet(name, period, header)
+            response = self.quota.write(
+                archive.append_rows, [values for _, values in entries]
+            )
+            rows_written = self.parse_updated_rows(response)
+            index = self.archive_index.get(name)
+            if index is not None and rows_written is not None:
+                for (_, values), row in zip(entries, rows_written):
+                    index[cell(values, id_col)] = (archive.title, row)
+
+        row_numbers = sorted(
+            (
+                row_number
+                for entries in archived_by_period.values()
+                for row_number, _ in entries
+            ),
+            reverse=True,
+        )
+        requests = [
+            {
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": sheet.id,
+                        "dimension": "ROWS",
+                        "startIndex": row_number - 1,
+                        "endIndex": row_number,
+                    }
+                }
+            }
+            for row_number in row_numbers
+        ]
+        self.quota.write(self.spreadsheet.batch_update, {"requests": requests})
+        with self.row_index_lock:
+            self.row_index.pop(sheet.title, None)
+            self.row_index_last_row[sheet.title] = len(rows) - len(row_numbers)
+        logging.info(f"Archived {len(row_numbers)} closed rows from {name}")
+        return len(row_numbers)
+
+    def archive_all(self):
+        for name in self.closed_columns:
+            try:
+                self.archive_closed_rows(name)
+            except Exception as e:
+                logging.error(f"Failed to archive {name} rows: {str(e)}")
+
+    def run_archiving(self):
+        time.sleep(ARCHIVE_STARTUP_DELAY)
+        while True:
+            self.archive_all()
+            time.sleep(ARCHIVE_INTERVAL)
+
+    def start_archiving(self):
+        if ARCHIVE_AFTER_DAYS <= 0:
+            return None
+        thread = threading.Thread(
+            target=self.run_archiving, name="sheet-archiving", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def load_slot_catalog(self):
+        catalog = {}
+        for row in self.quota.read(self.slot_data.get_all_values):
+            if len(row) >= 3:
+                catalog.setdefault(row[0], []).append(row[2])
+        for slots in catalog.values():
+            slots.sort(key=slot_sorting_key)
+        with self.slot_catalog_lock:
+            self.slot_catalog = catalog
+            self.slot_catalog_loaded_at = time.monotonic()
+            self.slot_catalog_refreshing = False
+        if self.on_slot_catalog:
+            self.on_slot_catalog(catalog)
+        return catalog
+
+    def refresh_slot_catalog(self):
+        try:
+            return self.load_slot_catalog()
+        except Exception as e:
+            logging.error(f"Failed to refresh slot catalog: {str(e)}")
+            with self.slot_catalog_lock:
+                self.slot_catalog_refreshing = False
+            return None
+
+    def refresh_slot_catalog_in_background(self):
+        with self.slot_catalog_lock:
+            if self.slot_catalog_refreshing:
+                return
+            self.slot_catalog_refreshing = True
+        threading.Thread(
+            target=self.refresh_slot_catalog, name="slot-catalog", daemon=True
+        ).start()
+
+    def refresh_slot_catalog_if_stale(self):
+        if (
+            self.slot_catalog is None
+            or time.monotonic() - self.slot_catalog_loaded_at > SLOT_CATALOG_TTL
+        ):
+            self.refresh_slot_catalog_in_background()
+
+    def get_slots_by_grade(self, grade):
+        catalog = self.slot_catalog
+        if catalog is None:
+            catalog = self.refresh_slot_catalog()
+            if catalog is None:
+                return []
+        elif time.monotonic() - self.slot_catalog_loaded_at > SLOT_CATALOG_TTL:
+            self.refresh_slot_catalog_in_background()
+        return list(catalog.get(str(grade), []))
+
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.create_tables()
+
+    @property
+    def id_keys(self):
+        return {
+            "ticket": "ticket_ids",
+            "piket": "piket_id",
+            "emergency": "emergency_id",
+            "it_helpdesk": "it_helpdesk_id",
+        }
+
+    @property
+    def indexed_columns(self):
+        return {
+            "chit_chat": ["user_id", "timestamp"],
+            "ticket": ["user_ids", "timestamp"],
+            "piket": ["status", "timestamp"],
+            "emergency": ["timestamp"],
+            "it_helpdesk": ["timestamp"],
+        }
+
+    def columns_for(self, name):
+        col_mapping = self.col_mapping_for(name)
+        return sorted(col_mapping, key=col_mapping.get)
+
+    def create_tables(self):
+        for name in ["chit_chat", "ticket", "piket", "emergency", "it_helpdesk"]:
+            id_key = self.id_keys.get(name)
+            columns = [
+                f"{column} TEXT PRIMARY KEY" if column == id_key else f"{column} TEXT"
+                for column in self.columns_for(name)
+            ]
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(columns)})"
+            )
+            existing = {
+                row[1] for row in self.connection.execute(f"PRAGMA table_info({name})")
+            }
+            for column in self.columns_for(name):
+                if column not in existing:
+                    self.connection.execute(
+                        f"ALTER TABLE {name} ADD COLUMN {column} TEXT"
+                    )
+            for column in self.indexed_columns[name]:
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name}_{column}_idx "
+                    f"ON {name} ({column})"
+                )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS slot_catalog ("
+            "grade TEXT, position INTEGER, slot_name TEXT, "
+            "PRIMARY KEY (grade, position))"
+        )
+
+    def append_record(self, name, row_id, values):
+        columns = self.columns_for(name)[: len(values)]
+        placeholders = ", ".join("?" for _ in columns)
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"INSERT OR IGNORE INTO {name} ({', '.join(columns)}) "
+                f"VALUES ({placeholders})",
+                values,
+            )
+
+    def update_record(self, name, row_id, updates):
+        if not updates:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in updates)
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"UPDATE {name} SET {assignments} WHERE {self.id_keys[name]} = ?",
+                list(updates.values()) + [row_id],
+            )
+
+    def replace_slot_catalog(self, catalog):
+        rows = [
+            (grade, position, slot_name)
+            for grade, slots in catalog.items()
+            for position, slot_name in enumerate(slots)
+        ]
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM slot_catalog")
+            self.connection.executemany(
+                "INSERT INTO slot_catalog (grade, position, slot_name) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def has_slot_catalog(self):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM slot_catalog LIMIT 1"
+            ).fetchone()
+        return row is not None
+
+    def get_slots_by_grade(self, grade):
+        try:
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT slot_name FROM slot_catalog WHERE grade = ? "
+                    "ORDER BY position",
+                    (str(grade),),
+                ).fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            logging.error(f"Failed to fetch slots for grade {grade}: {str(e)}")
+            return []
+
+
+class SheetManager(StorageBackend):
+    """Front door for ticket storage used by the Slack handlers.
+
+    Reads and writes hit the primary backend (local SQLite by default). The
+    spreadsheet stays in sync as an asynchronous replica for the humans who
+    read it, and remains the source of the slot catalog.
+    """
+
+    def __init__(
+        self,
+        creds_dict,
+        sheet_key,
+        db_path=STORAGE_DB_PATH,
+        spool_path=SHEET_SPOOL_PATH,
+        primary=STORAGE_PRIMARY,
+        client=None,
+    ):
+        if primary == "sheets":
+            self.sheets = SheetsBackend(
+                creds_dict, sheet_key, spool_path, client=client
+            )
+            self.primary = self.sheets
+            self.replicas = []
+        else:
+            self.primary = SQLiteBackend(db_path)
+            self.sheets = SheetsBackend(
+                creds_dict,
+                sheet_key,
+                spool_path,
+                on_slot_catalog=self.primary.replace_slot_catalog,
+                client=client,
+            )
+            self.replicas = [self.sheets]
+
+    @property
+    def backends(self):
+        return [self.primary] + self.replicas
+
+    def append_record(self, name, row_id, values):
+        for backend in self.backends:
+            try:
+                backend.append_record(name, row_id, values)
+            except Exception as e:
+                logging.error(
+                    f"Failed to append {name} row on {type(backend).__name__}: {str(e)}"
+                )
+
+    def update_record(self, name, row_id, updates):
+        for backend in self.backends:
+            try:
+                backend.update_record(name, row_id, updates)
+            except Exception as e:
+                logging.error(
+                    f"Failed to update {name} row on {type(backend).__name__}: {str(e)}"
+                )
+
+    def get_slots_by_grade(self, grade):
+        if self.primary is self.sheets:
+            return self.sheets.get_slots_by_grade(grade)
+        self.sheets.refresh_slot_catalog_if_stale()
+        if not self.primary.has_slot_catalog():
+            return self.sheets.get_slots_by_grade(grade)
+        return self.primary.get_slots_by_grade(grade)
+
+    def stats(self):
+        return {
+            "sheets_calls": self.sheets.quota.stats(),
+            "pending_sheet_writes": len(self.sheets.write_queue.pending),
+        }
+
+    def warm_up(self):
+        return self.sheets.warm_up()
+
+    def start_warm_up(self):
+        return self.sheets.start_warm_up()
+
+    def start_archiving(self):
+        return self.sheets.start_archiving()
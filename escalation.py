@@ -0,0 +1,323 @@
+"""Escalation of tickets nobody has picked up.
+
+Each category has a ladder of stages, minutes after the ticket was posted
+and whom to mention then. Stages due at about the same time in one channel
+are sent as a single digest rather than one message per ticket, so an
+incident with many waiting tickets stays within Slack's posting rate.
+Pending stages are stored with the ticket state, so they survive restarts.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from slack_sdk.errors import SlackApiError
+
+ESCALATION_MODE = os.getenv("ESCALATION_MODE", "local")
+ESCALATION_DIGEST_SECONDS = float(os.getenv("ESCALATION_DIGEST_SECONDS", "10"))
+DIGEST_MAX_LINES = 20
+
+
+def mention(user_or_group_id):
+    if user_or_group_id in ("here", "channel"):
+        return f"<!{user_or_group_id}>"
+    if user_or_group_id.startswith("S"):
+        return f"<!subteam^{user_or_group_id}>"
+    return f"<@{user_or_group_id}>"
+
+
+def load_policy(default):
+    """Returns {category: [(minutes, targets), ...]} sorted by minutes.
+
+    The ESCALATION_POLICY environment variable, a JSON object in the same
+    shape, replaces the ladders of the categories it names.
+    """
+    policy = dict(default)
+    override = os.getenv("ESCALATION_POLICY")
+    if override:
+        try:
+            policy.update(json.loads(override))
+        except ValueError as e:
+            logging.error(f"Ignoring invalid ESCALATION_POLICY: {str(e)}")
+    return {
+        category: sorted((float(minutes), list(targets)) for minutes, targets in ladder)
+        for category, ladder in policy.items()
+    }
+
+
+class Escalator:
+    """Runs each ticket's escalation ladder on `scheduler` until the ticket
+    leaves the "unassigned" status or `cancel` is called for it."""
+
+    def __init__(
+        self, ticket_manager, scheduler, policy, digest_delay=ESCALATION_DIGEST_SECONDS
+    ):
+        self.ticket_manager = ticket_manager
+        self.scheduler = scheduler
+        self.policy = policy
+        self.digest_delay = digest_delay
+        self.queued = {}
+        self.lock = threading.Lock()
+
+    def waiting(self, ticket_ts):
+        return self.ticket_manager.get_ticket_status(ticket_ts) == "unassigned"
+
+    def schedule(self, client, ticket_ts, reminder):
+        """Stores the reminder's stage and schedules it, counted from the
+        ticket's own timestamp."""
+        minutes, _ = self.policy[reminder["category"]][reminder["stage"]]
+        due_at = float(ticket_ts) + minutes * 60
+        self.ticket_manager.store_reminder(ticket_ts, reminder, due_at)
+        return self.scheduler.call_later(
+            max(due_at - self.ticket_manager.clock(), 0),
+            self.escalate,
+            client,
+            ticket_ts,
+            reminder,
+            key=ticket_ts,
+        )
+
+    def start(self, client, category, channel_id, thread_ts):
+        """Starts the ladder for a ticket posted at `thread_ts`. Returns the
+        first stage's handle, or None if the category has no ladder."""
+        if not self.policy.get(category):
+            return None
+        reminder = {
+            "channel_id": channel_id,
+            "thread_ts": thread_ts,
+            "category": category,
+            "stage": 0,
+        }
+        return self.schedule(client, thread_ts, reminder)
+
+    def cancel(self, ticket_ts):
+        self.ticket_manager.drop_reminder(ticket_ts)
+        reminder = self.scheduler.pending(ticket_ts)
+        if reminder:
+            reminder.cancel()
+
+    def restore(self, client):
+        """Schedules the stored reminders again. A ticket whose later stages
+        fell due while the bot was down skips to the latest of them, and
+        overdue stages go out in the first digest."""
+        now = self.ticket_manager.clock()
+        restored = 0
+        for ticket_ts, reminder in self.ticket_manager.pending_reminders():
+            # Reminders stored before the ladders existed were all Others.
+            reminder.setdefault("category", "Others")
+            reminder.pop("due_at", None)
+            ladder = self.policy.get(reminder["category"])
+            waited = (now - float(ticket_ts)) / 60
+            if "scheduled_message_ids" in reminder:
+                # Left by the Slack mode, which has sent the stages due so far.
+                self.delete_scheduled(client, reminder)
+                reminder = {
+                    "channel_id": reminder["channel_id"],
+                    "thread_ts": reminder["thread_ts"],
+                    "category": reminder["category"],
+                    "stage": sum(minutes <= waited for minutes, _ in ladder or []),
+                }
+            reminder.setdefault("stage", 0)
+            if (
+                not ladder
+                or reminder["stage"] >= len(ladder)
+                or not self.waiting(ticket_ts)
+            ):
+                self.ticket_manager.drop_reminder(ticket_ts)
+                continue
+            while (
+                reminder["stage"] + 1 < len(ladder)
+                and ladder[reminder["stage"] + 1][0] <= waited
+            ):
+                reminder["stage"] += 1
+            reminder["stage"] = min(reminder["stage"], len(ladder) - 1)
+            self.schedule(client, ticket_ts, reminder)
+            restored += 1
+        logging.info(f"Restored {restored} ticket escalations")
+
+    def escalate(self, client, ticket_ts, reminder):
+        """Queues the stage for its channel's next digest. The stored stage
+        stays until the digest is posted, so a restart in between sends it."""
+        if not self.waiting(ticket_ts):
+            self.ticket_manager.drop_reminder(ticket_ts)
+            return
+        channel_id = reminder["channel_id"]
+        with self.lock:
+            queued = self.queued.setdefault(channel_id, [])
+            queued.append((ticket_ts, reminder))
+            first = len(queued) == 1
+        if first:
+            self.scheduler.call_later(self.digest_delay, self.flush, client, channel_id)
+
+    def flush(self, client, channel_id):
+        """Claims and posts the stages queued for `channel_id`, then schedules
+        each ticket's next stage. A failed post stores the stages again."""
+        with self.lock:
+            queued = self.queued.pop(channel_id, [])
+        claimed = []
+        for ticket_ts, queued_reminder in queued:
+            # Gone if the escalation was cancelled or another instance sent it,
+            # and at a later stage if another instance sent this one already.
+            reminder = self.ticket_manager.claim_reminder(
+                ticket_ts, queued_reminder["stage"]
+            )
+            if reminder and self.waiting(ticket_ts):
+                reminder.pop("due_at", None)
+                claimed.append((ticket_ts, reminder))
+        try:
+            self.post(client, channel_id, claimed)
+        except Exception as e:
+            logging.error(f"Failed to post escalations to {channel_id}: {str(e)}")
+            for ticket_ts, reminder in claimed:
+                self.schedule(client, ticket_ts, reminder)
+            return
+        for ticket_ts, reminder in claimed:
+            if reminder["stage"] + 1 < len(self.policy[reminder["category"]]):
+                next_stage = dict(reminder, stage=reminder["stage"] + 1)
+                self.schedule(client, ticket_ts, next_stage)
+
+    def post(self, client, channel_id, queued):
+        """Posts escalations in the ticket's thread if there is one, or as a
+        single digest otherwise."""
+        if len(queued) == 1:
+            ticket_ts, reminder = queued[0]
+            client.chat_postMessage(
+                channel=channel_id,
+                thread_ts=reminder["thread_ts"],
+                text=self.reminder_text(reminder),
+            )
+        elif queued:
+            client.chat_postMessage(channel=channel_id, text=self.digest_text(queued))
+
+    def delete_scheduled(self, client, reminder):
+        """Deletes the stages the Slack mode scheduled for a reminder."""
+        for scheduled_message_id in reminder.get("scheduled_message_ids", []):
+            try:
+                client.chat_deleteScheduledMessage(
+                    channel=reminder["channel_id"],
+                    scheduled_message_id=scheduled_message_id,
+                )
+            except SlackApiError as e:
+                # Stages Slack has already sent can no longer be deleted.
+                logging.info(f"Scheduled escalation not deleted: {str(e)}")
+
+    def targets(self, reminder):
+        return self.policy[reminder["category"]][reminder["stage"]][1]
+
+    def reminder_text(self, reminder):
+        ladder = self.policy[reminder["category"]]
+        targets = " ".join(mention(target) for target in self.targets(reminder))
+        if reminder["stage"] + 1 < len(ladder):
+            minutes = ladder[reminder["stage"] + 1][0] - ladder[reminder["stage"]][0]
+            return f"Ribbit! 🐸 Pepe’s getting impatient, and this ticket's feeling lonely! Can you {targets} hop in and rescue it within the next {minutes:g} minutes before Pepe starts croaking louder? 🐸⏳"
+        return f"Ribbit! 🐸 Pepe is croaking as loud as it can, this ticket is still all alone! Can you {targets} hop in and rescue it right now? 🐸📣"
+
+    def digest_text(self, queued):
+        now = self.ticket_manager.clock()
+        lines = []
+        targets = []
+        for ticket_ts, reminder in queued:
+            ticket_id = self.ticket_manager.get_field(ticket_ts, "ticket_id", "ticket")
+            waited = (now - float(ticket_ts)) / 60
+            lines.append(
+                f"• `{ticket_id}` ({reminder['category']}), waiting {waited:.0f} min"
+            )
+            for target in self.targets(reminder):
+                if target not in targets:
+                    targets.append(target)
+        if len(lines) > DIGEST_MAX_LINES:
+            more = len(lines) - DIGEST_MAX_LINES
+            lines = lines[:DIGEST_MAX_LINES] + [f"…and {more} more"]
+        return (
+            f"Ribbit! 🐸 {len(queued)} tickets are waiting for someone to pick them up:\n"
+            + "\n".join(lines)
+            + f"\nCan you {' '.join(mention(target) for target in targets)} hop in? 🐸⏳"
+        )
+
+
+class SlackScheduledEscalator(Escalator):
+    """Escalator that hands a ticket's whole ladder to Slack's
+    chat.scheduleMessage when the ticket is posted, so the process keeps no
+    timers. The scheduled message IDs are stored with the ticket state, and
+    `cancel` deletes them from whichever instance handles the ticket.
+
+    Slack sends each stage as scheduled: stages are neither batched into
+    digests nor checked against the ticket's status, so every handler that
+    moves a ticket must cancel its escalation.
+    """
+
+    def __init__(self, ticket_manager, policy, client):
+        super().__init__(ticket_manager, None, policy)
+        self.client = client
+
+    def start(self, client, category, channel_id, thread_ts):
+        """Schedules the ladder's stages that are still ahead. Returns their
+        scheduled message IDs, or None if the category has no ladder."""
+        ladder = self.policy.get(category)
+        if not ladder:
+            return None
+        now = self.ticket_manager.clock()
+        scheduled = []
+        for stage, (minutes, _) in enumerate(ladder):
+            post_at = int(float(thread_ts) + minutes * 60)
+            if post_at <= now:
+                continue
+            try:
+                response = client.chat_scheduleMessage(
+                    channel=channel_id,
+                    post_at=post_at,
+                    thread_ts=thread_ts,
+                    text=self.reminder_text({"category": category, "stage": stage}),
+                )
+                scheduled.append(response["scheduled_message_id"])
+            except SlackApiError as e:
+                logging.error(f"Failed to schedule escalation {stage}: {str(e)}")
+        if scheduled:
+            reminder = {
+                "channel_id": channel_id,
+                "thread_ts": thread_ts,
+                "category": category,
+                "scheduled_message_ids": scheduled,
+            }
+            self.ticket_manager.store_reminder(thread_ts, reminder, post_at)
+        return scheduled
+
+    def cancel(self, ticket_ts):
+        reminder = self.ticket_manager.claim_reminder(ticket_ts)
+        if reminder:
+            self.delete_scheduled(self.client, reminder)
+
+    def restore(self, client):
+        """Slack keeps its schedule across restarts. Reminders left by the
+        local mode move to Slack: the latest stage that fell due while they
+        were stored is sent now, batched per channel like the local digests,
+        and the later stages are scheduled."""
+        now = self.ticket_manager.clock()
+        overdue = {}
+        for ticket_ts, reminder in self.ticket_manager.pending_reminders():
+            if "scheduled_message_ids" in reminder:
+                continue
+            self.ticket_manager.drop_reminder(ticket_ts)
+            category = reminder.get("category", "Others")
+            ladder = self.policy.get(category)
+            if not ladder or not self.waiting(ticket_ts):
+                continue
+            waited = (now - float(ticket_ts)) / 60
+            due = sum(minutes <= waited for minutes, _ in ladder)
+            if due > reminder.get("stage", 0):
+                overdue.setdefault(reminder["channel_id"], []).append(
+                    (ticket_ts, dict(reminder, category=category, stage=due - 1))
+                )
+            self.start(client, category, reminder["channel_id"], reminder["thread_ts"])
+        for channel_id, queued in overdue.items():
+            try:
+                self.post(client, channel_id, queued)
+            except SlackApiError as e:
+                logging.error(f"Failed to post escalations to {channel_id}: {str(e)}")
+
+
+def create_escalator(ticket_manager, scheduler, policy, client, mode=ESCALATION_MODE):
+    if mode == "slack":
+        return SlackScheduledEscalator(ticket_manager, policy, client)
+    return Escalator(ticket_manager, scheduler, policy)
@@ -0,0 +1,200 @@
+"""Offline benchmark for ticket escalations.
+
+Posts a burst of tickets to the in-process Slack stand-in from fake_slack.py,
+picks some of them up at random times and runs their escalation ladders on a
+virtual clock, once per escalation mode. Optionally takes the bot down part
+way through and restarts it, in the same or in the other mode. Reports the
+Slack API calls and messages each mode needs, stages sent after a ticket was
+picked up, and waiting tickets whose latest due stage never went out.
+
+    python escalation_benchmark.py --tickets 200 --minutes 60 --restart-at 12 \
+        --downtime 5 --switch-modes
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+
+import escalation
+from escalation import create_escalator, load_policy
+from fake_slack import FakeSlackClient
+from reminders import Scheduler, VirtualClock
+from tickets import TicketManager
+
+CHANNEL = "C_OPS"
+POLICY = {"Others": [(3, ["U_LEAD"]), (10, ["U_LEAD"]), (30, ["here"])]}
+
+
+class Bot:
+    """The parts of the bot that escalations touch. Like app.py, tickets run
+    on the wall clock, here the stand-in's, and the scheduler on a monotonic
+    one, here a VirtualClock moved in step with it."""
+
+    def __init__(self, mode, slack, monotonic, db_path):
+        self.slack = slack
+        self.ticket_manager = TicketManager(
+            db_path, journal_dir=None, clock=slack.clock
+        )
+        self.scheduler = Scheduler(monotonic)
+        self.escalator = create_escalator(
+            self.ticket_manager, self.scheduler, load_policy(POLICY), slack, mode
+        )
+
+
+def run_mode(args, mode, restart_mode, workdir):
+    rng = random.Random(args.seed)
+    slack = FakeSlackClient()
+    monotonic = VirtualClock()
+    db_path = os.path.join(workdir, f"{mode}-{restart_mode}.db")
+    bot = Bot(mode, slack, monotonic, db_path)
+
+    tickets = {}
+    pickups = {}
+    calls_before = dict(slack.calls)
+    for i in range(args.tickets):
+        thread_ts = slack.chat_postMessage(channel=CHANNEL, text=f"ticket {i}")["ts"]
+        ticket_id = f"live-ops.{i:06d}"
+        bot.ticket_manager.update(thread_ts, ticket_id=ticket_id, status="unassigned")
+        bot.escalator.start(slack, "Others", CHANNEL, thread_ts)
+        tickets[thread_ts] = ticket_id
+        if rng.random() < args.pickup_rate:
+            pickups.setdefault(rng.randrange(1, args.minutes * 60), []).append(
+                thread_ts
+            )
+    started = slack.now
+    # The tickets themselves are not escalation calls.
+    calls_before["chat.postMessage"] = args.tickets
+
+    picked_at = {}
+    down_at = args.restart_at * 60 if args.restart_at else None
+    up_at = down_at + args.downtime * 60 if args.restart_at else None
+    for second in range(1, args.minutes * 60 + 1):
+        slack.advance(1)
+        monotonic.advance(1)
+        if down_at is not None and down_at <= second < up_at:
+            # Nobody can pick tickets up while the bot is down.
+            continue
+        if second == up_at:
+            # A new process starts a new monotonic clock.
+            monotonic = VirtualClock()
+            bot = Bot(restart_mode, slack, monotonic, db_path)
+            bot.escalator.restore(slack)
+        for thread_ts in pickups.get(second, []):
+            if bot.ticket_manager.transition(thread_ts, ("unassigned",), "assigned"):
+                bot.escalator.cancel(thread_ts)
+                picked_at[thread_ts] = slack.now
+        bot.scheduler.run_due()
+
+    calls = {
+        method: count - calls_before.get(method, 0)
+        for method, count in slack.calls.items()
+        if count > calls_before.get(method, 0)
+    }
+    return dict(
+        check_escalations(slack, tickets, picked_at, started),
+        calls=sum(calls.values()),
+        calls_by_method=calls,
+        scheduled_left=len(slack.scheduled),
+    )
+
+
+def check_escalations(slack, tickets, picked_at, started):
+    """Matches each escalation message to the tickets it names: thread
+    replies by their thread, digests by the ticket IDs they list. Times are
+    compared in whole seconds, the resolution of the benchmark's clock and of
+    Slack's `post_at`."""
+    seen = {thread_ts: [] for thread_ts in tickets}
+    messages = 0
+    for message in slack.messages(CHANNEL) + [
+        reply for thread_ts in tickets for reply in slack.messages(CHANNEL, thread_ts)
+    ]:
+        if "Ribbit" not in (message.get("text") or ""):
+            continue
+        messages += 1
+        posted_at = int(float(message["ts"]))
+        if message.get("thread_ts"):
+            seen[message["thread_ts"]].append(posted_at)
+            continue
+        for thread_ts, ticket_id in tickets.items():
+            if f"`{ticket_id}`" in message["text"]:
+                seen[thread_ts].append(posted_at)
+
+    ladder = load_policy(POLICY)["Others"]
+    late = 0
+    missed = 0
+    for thread_ts, times in seen.items():
+        picked = picked_at.get(thread_ts)
+        if picked is not None:
+            late += sum(posted_at > picked for posted_at in times)
+            continue
+        due = [
+            int(float(thread_ts) + minutes * 60)
+            for minutes, _ in ladder
+            if float(thread_ts) + minutes * 60 <= slack.now
+        ]
+        if due and not any(posted_at >= due[-1] for posted_at in times):
+            missed += 1
+    return {
+        "messages": messages,
+        "late": late,
+        "missed": missed,
+        "picked_up": len(picked_at),
+        "minutes": (slack.now - started) / 60,
+    }
+
+
+def print_report(args, results):
+    print(
+        f"tickets={args.tickets} minutes={args.minutes} "
+        f"pickup_rate={args.pickup_rate} restart_at={args.restart_at} "
+        f"downtime={args.downtime}"
+    )
+    print(
+        f"{'mode':<12} {'calls':>7} {'messages':>9} {'picked up':>9} "
+        f"{'late':>5} {'missed':>6} {'scheduled left':>14}"
+    )
+    for mode, result in results.items():
+        print(
+            f"{mode:<12} {result['calls']:>7} {result['messages']:>9} "
+            f"{result['picked_up']:>9} {result['late']:>5} {result['missed']:>6} "
+            f"{result['scheduled_left']:>14}"
+        )
+        print(f"{'':<12} {result['calls_by_method']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=50)
+    parser.add_argument("--minutes", type=int, default=45)
+    parser.add_argument("--pickup-rate", type=float, default=0.5)
+    parser.add_argument("--restart-at", type=int, default=0)
+    parser.add_argument("--downtime", type=int, default=0)
+    parser.add_argument("--switch-modes", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    # List every ticket a digest covers, so each can be matched to its stages.
+    escalation.DIGEST_MAX_LINES = args.tickets
+    runs = [("local", "local"), ("slack", "slack")]
+    if args.switch_modes:
+        runs += [("local", "slack"), ("slack", "local")]
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {
+            mode if mode == restart_mode else f"{mode}>{restart_mode}": run_mode(
+                args, mode, restart_mode, workdir
+            )
+            for mode, restart_mode in runs
+        }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(args, results)
+
+
+if __name__ == "__main__":
+    main()
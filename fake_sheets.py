@@ -0,0 +1,339 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import gspread
+
+from database import TICKET_ID_RANDOM_CHARS, TICKET_ID_TIME_CHARS, encode_base32
+
+a1_pattern = re.compile(r"^(?:.*!)?([A-Z]+)(\d+)$")
+
+
+def a1_to_rowcol(label):
+    match = a1_pattern.match(label)
+    letters, row = match.group(1), int(match.group(2))
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter) - ord("A") + 1
+    return row, col
+
+
+def col_to_letters(col):
+    letters = ""
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+class FakeResponse:
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = json.dumps(
+            {"error": {"code": status_code, "message": message, "status": message}}
+        )
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeStats:
+    """Counts calls and approximate JSON bytes moved over the fake API."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = {}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.errors = 0
+
+    def record(self, method, sent=None, received=None):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if sent is not None:
+                self.bytes_sent += len(json.dumps(sent, default=str))
+            if received is not None:
+                self.bytes_received += len(json.dumps(received, default=str))
+
+    def record_error(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "calls": sum(self.calls.values()),
+                "calls_by_method": dict(self.calls),
+                "bytes": self.bytes_sent + self.bytes_received,
+                "errors": self.errors,
+            }
+
+
+class FakeClient:
+    """In-process stand-in for the parts of gspread that SheetManager uses.
+
+    `latency` is added to every API call, and `error_rate` is the chance that
+    a call fails with a 429 quota error instead of running.
+    """
+
+    def __init__(self, latency=0, error_rate=0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats = FakeStats()
+        self.spreadsheets = {}
+
+    def api_call(self, method):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats.record_error(method)
+            raise gspread.exceptions.APIError(FakeResponse(429, "RESOURCE_EXHAUSTED"))
+
+    def open_by_key(self, key):
+        self.api_call("open_by_key")
+        if key not in self.spreadsheets:
+            self.spreadsheets[key] = FakeSpreadsheet(self, key)
+        spreadsheet = self.spreadsheets[key]
+        self.stats.record("open_by_key", received={"id": key})
+        return spreadsheet
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, key):
+        self.client = client
+        self.id = key
+        self.sheets = {}
+        self.next_sheet_id = 1
+
+    def create_worksheet(self, title, rows=None):
+        worksheet = FakeWorksheet(self, title, self.next_sheet_id, rows or [])
+        self.next_sheet_id += 1
+        self.sheets[title] = worksheet
+        return worksheet
+
+    def worksheets(self):
+        self.client.api_call("worksheets")
+        self.client.stats.record(
+            "worksheets", received=[{"title": title} for title in self.sheets]
+        )
+        return list(self.sheets.values())
+
+    def worksheet(self, title):
+        self.client.api_call("worksheet")
+        self.client.stats.record("worksheet", received={"title": title})
+        return self.sheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self.client.api_call("add_worksheet")
+        self.client.stats.record("add_worksheet", sent={"title": title})
+        return self.create_worksheet(title)
+
+    def batch_update(self, body):
+        self.client.api_call("spreadsheet.batch_update")
+        self.client.stats.record("spreadsheet.batch_update", sent=body)
+        sheets_by_id = {sheet.id: sheet for sheet in self.sheets.values()}
+        for request in body.get("requests", []):
+            dimension_range = request["deleteDimension"]["range"]
+            sheet = sheets_by_id[dimension_range["sheetId"]]
+            del sheet.rows[dimension_range["startIndex"] : dimension_range["endIndex"]]
+        return {"replies": []}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, rows):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.title = title
+        self.id = sheet_id
+        self.rows = rows
+        # Like gspread, the grid size read when the worksheet was opened;
+        # appends and deletes do not change it.
+        self.row_count = len(rows)
+        self.lock = threading.Lock()
+
+    def updated_range(self, first_row, last_row, width):
+        return f"{self.title}!A{first_row}:{col_to_letters(max(width, 1))}{last_row}"
+
+    def get(self, range_name):
+        self.client.api_call("get")
+        first, last = range_name.split("!")[-1].split(":")
+        first_row, first_col = a1_to_rowcol(first)
+        last_row, last_col = a1_to_rowcol(last)
+        with self.lock:
+            values = [
+                row[first_col - 1 : last_col]
+                for row in self.rows[first_row - 1 : last_row]
+            ]
+        while values and not any(values[-1]):
+            values.pop()
+        self.client.stats.record("get", sent=range_name, received=values)
+        return values
+
+    def batch_get(self, ranges, **kwargs):
+        self.client.api_call("batch_get")
+        values = []
+        with self.lock:
+            for range_name in ranges:
+                cells = range_name.split("!")[-1].split(":")
+                first_row, first_col = a1_to_rowcol(cells[0])
+                last_row, last_col = a1_to_rowcol(cells[-1])
+                block = [
+                    row[first_col - 1 : last_col]
+                    for row in self.rows[first_row - 1 : last_row]
+                ]
+                while block and not any(block[-1]):
+                    block.pop()
+                values.append(block)
+        self.client.stats.record("batch_get", sent=ranges, received=values)
+        return values
+
+    def col_values(self, col):
+        self.client.api_call("col_values")
+        with self.lock:
+            values = [row[col - 1] if len(row) >= col else "" for row in self.rows]
+        while values and values[-1] == "":
+            values.pop()
+        self.client.stats.record("col_values", received=values)
+        return values
+
+    def get_all_values(self):
+        self.client.api_call("get_all_values")
+        with self.lock:
+            width = max((len(row) for row in self.rows), default=0)
+            values = [row + [""] * (width - len(row)) for row in self.rows]
+        self.client.stats.record("get_all_values", received=values)
+        return values
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], method="append_row")
+
+    def append_rows(self, values, method="append_rows", **kwargs):
+        self.client.api_call(method)
+        with self.lock:
+            first_row = len(self.rows) + 1
+            self.rows.extend([[str(value) for value in row] for row in values])
+            last_row = len(self.rows)
+        width = max((len(row) for row in values), default=0)
+        response = {
+            "updates": {"updatedRange": self.updated_range(first_row, last_row, width)}
+        }
+        self.client.stats.record(method, sent=values, received=response)
+        return response
+
+    def set_cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        if len(cells) < col:
+            cells.extend([""] * (col - len(cells)))
+        cells[col - 1] = str(value)
+
+    def update_cell(self, row, col, value):
+        self.client.api_call("update_cell")
+        with self.lock:
+            self.set_cell(row, col, value)
+        self.client.stats.record("update_cell", sent=[row, col, value])
+
+    def batch_update(self, data, **kwargs):
+        self.client.api_call("batch_update")
+        with self.lock:
+            for value_range in data:
+                row, col = a1_to_rowcol(value_range["range"])
+                self.set_cell(row, col, value_range["values"][0][0])
+        self.client.stats.record("batch_update", sent=data)
+
+
+def build_spreadsheet(
+    client, key, rows=10000, grades=12, slots_per_grade=40, legacy_ids=False
+):
+    """Create a spreadsheet shaped like the production one.
+
+    Each ticket worksheet gets a header and `rows` synthetic rows, about a
+    tenth of them still open. IDs are time-ordered unless `legacy_ids` asks
+    for the old random UUIDs.
+    """
+
+    def synthetic_id(prefix, i):
+        if legacy_ids:
+            return f"{prefix}{uuid.UUID(int=i)}"
+        return (
+            prefix
+            + encode_base32(1700000000000 + i, TICKET_ID_TIME_CHARS)
+            + encode_base32(i, TICKET_ID_RANDOM_CHARS)
+        )
+
+    spreadsheet = client.spreadsheets.setdefault(key, FakeSpreadsheet(client, key))
+    timestamp = "2024-01-01 08:00:00"
+
+    def closed(i):
+        return i % 10 != 0
+
+    spreadsheet.create_worksheet(
+        "chit_chat",
+        [
+            [
+                "chat_timestamp",
+                "timestamp",
+                "user_id",
+                "user_name",
+                "email",
+                "phone",
+                "text",
+            ]
+        ],
+    )
+    spreadsheet.create_worksheet(
+        "ticket",
+        [["timestamp", "ticket_ids", "user_ids", "user_names", "user_issue"]]
+        + [
+            [timestamp, synthetic_id("live-ops.", i), "U0000", "Reporter", "issue"]
+            + (["Zoom", "Staff", timestamp, "Staff", timestamp] if closed(i) else [])
+            for i in range(rows)
+        ],
+    )
+    spreadsheet.create_worksheet(
+        "piket",
+        [["piket_id", "timestamp", "teacher_requested", "teacher_replaces"]]
+        + [
+            [synthetic_id("piket.", i), timestamp, "Teacher", "Mentor", "7", "Math 1"]
+            + ([""] * 5 + ["Approved", "Staff", timestamp] if closed(i) else [])
+            for i in range(rows)
+        ],
+    )
+    spreadsheet.create_worksheet(
+        "emergency",
+        [["emergency_id", "timestamp", "user_reported", "resolved_by", "resolved_at"]]
+        + [
+            [synthetic_id("emergency-", i), timestamp, "Teacher"]
+            + (["Staff", timestamp] if closed(i) else [])
+            for i in range(rows)
+        ],
+    )
+    spreadsheet.create_worksheet(
+        "it_helpdesk",
+        [["it_helpdesk_id", "timestamp", "user_reported", "issue_type"]]
+        + [
+            [synthetic_id("it-helpdesk.", i), timestamp, "Staff", "laptop issue"]
+            + ([""] * 4 + ["Support", timestamp] if closed(i) else [])
+            for i in range(rows)
+        ],
+    )
+    spreadsheet.create_worksheet(
+        "slot_data",
+        [["grade", "day", "slot_name"]]
+        + [
+            [str(grade), "Mon", f"Subject {slot % 7} {slot}"]
+            for grade in range(1, grades + 1)
+            for slot in range(slots_per_grade)
+        ],
+    )
+    return spreadsheet
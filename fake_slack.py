@@ -0,0 +1,202 @@
+import itertools
+import threading
+
+from slack_sdk.errors import SlackApiError
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200, headers=None):
+        self.data = data
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+class FakeSlackClient:
+    """In-process stand-in for the Slack Web API methods the bot uses for
+    tickets, reminders and recovery.
+
+    Time stands still until `advance` moves it; scheduled messages are posted
+    once their `post_at` is reached. `clock` can be passed to TicketManager so
+    both agree on the time.
+    """
+
+    def __init__(self, now=1700000000.0):
+        self.now = now
+        self.last_micros = 0
+        self.channels = {}
+        self.scheduled = {}
+        self.calls = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.RLock()
+
+    def clock(self):
+        return self.now
+
+    def call(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def fail(self, method, error):
+        raise SlackApiError(
+            f"The request to the Slack API failed. (url: {method})",
+            FakeResponse({"ok": False, "error": error}),
+        )
+
+    def post(self, channel, message):
+        # Slack timestamps are unique per channel, even within a microsecond.
+        # Counted in whole microseconds, as floats this large cannot hold them.
+        self.last_micros = max(round(self.now * 1000000), self.last_micros + 1)
+        seconds, micros = divmod(self.last_micros, 1000000)
+        message = dict(message, ts=f"{seconds}.{micros:06d}")
+        self.channels.setdefault(channel, []).append(message)
+        return message
+
+    def chat_postMessage(
+        self, channel, text=None, blocks=None, thread_ts=None, metadata=None, **kwargs
+    ):
+        with self.lock:
+            self.call("chat.postMessage")
+            message = self.post(
+                channel,
+                {
+                    "text": text,
+                    "blocks": blocks,
+                    "thread_ts": thread_ts,
+                    "metadata": metadata,
+                },
+            )
+            return FakeResponse({"ok": True, "channel": channel, "ts": message["ts"]})
+
+    def chat_update(self, channel, ts, text=None, blocks=None, metadata=None, **kwargs):
+        with self.lock:
+            self.call("chat.update")
+            for message in self.channels.get(channel, []):
+                if message["ts"] == ts:
+                    message.update(text=text, blocks=blocks)
+                    # Like Slack, metadata is kept unless new metadata is sent.
+                    if metadata is not None:
+                        message["metadata"] = metadata
+                    return FakeResponse({"ok": True, "channel": channel, "ts": ts})
+            self.fail("chat.update", "message_not_found")
+
+    def chat_scheduleMessage(
+        self, channel, post_at, text=None, blocks=None, thread_ts=None, **kwargs
+    ):
+        with self.lock:
+            self.call("chat.scheduleMessage")
+            if float(post_at) <= self.now:
+                self.fail("chat.scheduleMessage", "time_in_past")
+            scheduled_message_id = f"Q{next(self.ids):010d}"
+            self.scheduled[scheduled_message_id] = {
+                "channel": channel,
+                "post_at": int(post_at),
+                "text": text,
+                "blocks": blocks,
+                "thread_ts": thread_ts,
+            }
+            return FakeResponse(
+                {
+                    "ok": True,
+                    "channel": channel,
+                    "scheduled_message_id": scheduled_message_id,
+                    "post_at": int(post_at),
+                }
+            )
+
+    def chat_deleteScheduledMessage(self, channel, scheduled_message_id, **kwargs):
+        with self.lock:
+            self.call("chat.deleteScheduledMessage")
+            message = self.scheduled.get(scheduled_message_id)
+            if message is None or message["channel"] != channel:
+                self.fail("chat.deleteScheduledMessage", "invalid_scheduled_message_id")
+            del self.scheduled[scheduled_message_id]
+            return FakeResponse({"ok": True})
+
+    def chat_scheduledMessages_list(self, channel=None, **kwargs):
+        with self.lock:
+            self.call("chat.scheduledMessages.list")
+            messages = [
+                {
+                    "id": scheduled_message_id,
+                    "channel_id": message["channel"],
+                    "post_at": message["post_at"],
+                    "text": message["text"],
+                }
+                for scheduled_message_id, message in self.scheduled.items()
+                if channel is None or message["channel"] == channel
+            ]
+            return FakeResponse({"ok": True, "scheduled_messages": messages})
+
+    def conversations_history(
+        self,
+        channel,
+        oldest=None,
+        latest=None,
+        inclusive=False,
+        limit=100,
+        cursor=None,
+        **kwargs,
+    ):
+        with self.lock:
+            self.call("conversations.history")
+            oldest = float(oldest) if oldest is not None else 0
+            latest = float(latest) if latest is not None else self.now
+
+            def in_range(ts):
+                if inclusive:
+                    return oldest <= ts <= latest
+                return oldest < ts < latest
+
+            messages = [
+                {key: value for key, value in message.items() if value is not None}
+                for message in reversed(self.channels.get(channel, []))
+                if not message.get("thread_ts") and in_range(float(message["ts"]))
+            ]
+            start = int(cursor or 0)
+            page = messages[start : start + limit]
+            has_more = start + limit < len(messages)
+            return FakeResponse(
+                {
+                    "ok": True,
+                    "messages": page,
+                    "has_more": has_more,
+                    "response_metadata": {
+                        "next_cursor": str(start + limit) if has_more else ""
+                    },
+                }
+            )
+
+    def advance(self, seconds):
+        """Moves time forward, posting the scheduled messages that fall due."""
+        with self.lock:
+            self.now += seconds
+            due = sorted(
+                (message["post_at"], scheduled_message_id)
+                for scheduled_message_id, message in self.scheduled.items()
+                if message["post_at"] <= self.now
+            )
+            for _, scheduled_message_id in due:
+                message = self.scheduled.pop(scheduled_message_id)
+                self.post(
+                    message["channel"],
+                    {
+                        "text": message["text"],
+                        "blocks": message["blocks"],
+                        "thread_ts": message["thread_ts"],
+                        "metadata": None,
+                    },
+                )
+
+    def messages(self, channel, thread_ts=None):
+        """Returns the messages posted to `channel`, or to one of its threads."""
+        with self.lock:
+            return [
+                message
+                for message in self.channels.get(channel, [])
+                if message.get("thread_ts") == thread_ts
+            ]
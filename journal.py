@@ -0,0 +1,224 @@
+"""Append-only journal of ticket lifecycle events.
+
+Events are JSON lines in gzip segments, flushed after every event so a crash
+loses at most the line being written. Every `JOURNAL_SNAPSHOT_EVERY` events
+the ticket manager writes a snapshot of its records and a new segment is
+started, so startup only replays the events after the latest snapshot.
+Segments are kept as the ticket history:
+
+    python journal.py report --since 2024-01-01
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+
+JOURNAL_DIR = os.getenv("TICKET_JOURNAL_DIR", "ticket_journal")
+JOURNAL_SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "5000"))
+SNAPSHOTS_KEPT = 2
+
+segment_pattern = re.compile(r"^events-(\d+)\.jsonl\.gz$")
+snapshot_pattern = re.compile(r"^snapshot-(\d+)\.json\.gz$")
+
+
+def read_lines(path):
+    """Yields the complete lines of a gzip file, stopping at a torn tail."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                if line.endswith("\n"):
+                    yield line
+    except EOFError:
+        # The segment a running or killed process was writing has no gzip
+        # trailer yet; every complete line before that point was read.
+        pass
+    except (OSError, zlib.error) as e:
+        logging.warning(f"Journal file {path} is corrupt after a point: {str(e)}")
+
+
+class TicketJournal:
+    def __init__(self, directory, snapshot_every=JOURNAL_SNAPSHOT_EVERY):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.seq = self.last_seq()
+        self.snapshot_seq = max(self.files(snapshot_pattern) or [0])
+        self.segment = None
+        self.snapshotting = False
+
+    def files(self, pattern):
+        """Returns {seq: path} for the journal files matching `pattern`."""
+        found = {}
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                found[int(match.group(1))] = os.path.join(self.directory, name)
+        return found
+
+    def last_seq(self):
+        segments = self.files(segment_pattern)
+        for first_seq in sorted(segments, reverse=True):
+            last = None
+            for line in read_lines(segments[first_seq]):
+                last = line
+            if last is not None:
+                return json.loads(last)["seq"]
+        return max(self.files(snapshot_pattern) or [0])
+
+    def close_segment(self):
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+
+    def append(self, event, key, fields, at):
+        with self.lock:
+            if self.segment is None:
+                # Segments are named after their first event. A new one per
+                # process start keeps a torn tail from an earlier crash out
+                # of the middle of a gzip stream.
+                path = os.path.join(
+                    self.directory, f"events-{self.seq + 1:012d}.jsonl.gz"
+                )
+                self.segment = gzip.open(path, "ab")
+            self.seq += 1
+            line = json.dumps(
+                {
+                    "seq": self.seq,
+                    "at": at,
+                    "event": event,
+                    "key": key,
+                    "fields": fields,
+                }
+            )
+            try:
+                self.segment.write(line.encode("utf-8") + b"\n")
+                self.segment.flush(zlib.Z_SYNC_FLUSH)
+            except Exception as e:
+                logging.error(f"Failed to journal {event} for {key}: {str(e)}")
+            return self.seq
+
+    def due_snapshot(self):
+        """Returns True once per snapshot, to the caller that should write it."""
+        with self.lock:
+            if self.snapshotting or self.seq - self.snapshot_seq < self.snapshot_every:
+                return False
+            self.snapshotting = True
+            return True
+
+    def write_snapshot(self, seq, entries):
+        """Stores `entries` (key, record dict, expires_at) as the state after
+        event `seq`, and starts a new segment."""
+        path = os.path.join(self.directory, f"snapshot-{seq:012d}.json.gz")
+        try:
+            data = json.dumps({"seq": seq, "entries": entries}).encode("utf-8")
+            with gzip.open(path + ".tmp", "wb", compresslevel=6) as file:
+                file.write(data)
+            os.replace(path + ".tmp", path)
+        finally:
+            with self.lock:
+                self.snapshotting = False
+        with self.lock:
+            self.snapshot_seq = seq
+            self.close_segment()
+        snapshots = self.files(snapshot_pattern)
+        for old_seq in sorted(snapshots)[:-SNAPSHOTS_KEPT]:
+            os.remove(snapshots[old_seq])
+
+    def latest_snapshot(self):
+        snapshots = self.files(snapshot_pattern)
+        for seq in sorted(snapshots, reverse=True):
+            try:
+                with gzip.open(snapshots[seq], "rt", encoding="utf-8") as file:
+                    snapshot = json.load(file)
+                return snapshot["seq"], snapshot["entries"]
+            except Exception as e:
+                logging.error(f"Skipping unreadable snapshot {seq}: {str(e)}")
+        return 0, []
+
+    def events(self, after_seq=0):
+        """Yields the journaled events with a sequence number after
+        `after_seq`, oldest first."""
+        segments = self.files(segment_pattern)
+        first_seqs = sorted(segments)
+        for i, first_seq in enumerate(first_seqs):
+            # Segments that end before after_seq cannot hold newer events.
+            if i + 1 < len(first_seqs) and first_seqs[i + 1] <= after_seq + 1:
+                continue
+            for line in read_lines(segments[first_seq]):
+                event = json.loads(line)
+                if event["seq"] > after_seq:
+                    yield event
+
+    def close(self):
+        with self.lock:
+            self.close_segment()
+
+
+def report(journal, since=None):
+    """Counts events by type and category, and the mean minutes from a
+    ticket's creation to its resolution or rejection."""
+    counts = {}
+    categories = {}
+    created_at = {}
+    closing_minutes = {}
+    for event in journal.events():
+        if since is not None and event["at"] < since:
+            continue
+        key = event["key"]
+        if "category" in event["fields"] and event["event"] == "created":
+            categories[key] = event["fields"]["category"]
+        category = categories.get(key, "unknown")
+        counts.setdefault(category, {}).setdefault(event["event"], 0)
+        counts[category][event["event"]] += 1
+        if event["event"] == "created":
+            created_at[key] = event["at"]
+        elif event["event"] in ("resolved", "rejected") and key in created_at:
+            minutes = (event["at"] - created_at.pop(key)) / 60
+            closing_minutes.setdefault(category, []).append(minutes)
+    return {
+        category: dict(
+            events,
+            mean_minutes_to_close=(
+                sum(closing_minutes[category]) / len(closing_minutes[category])
+                if closing_minutes.get(category)
+                else None
+            ),
+        )
+        for category, events in counts.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["report", "dump"])
+    parser.add_argument("--dir", default=JOURNAL_DIR)
+    parser.add_argument("--since", help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    since = (
+        time.mktime(datetime.strptime(args.since, "%Y-%m-%d").timetuple())
+        if args.since
+        else None
+    )
+    journal = TicketJournal(args.dir)
+    try:
+        if args.command == "dump":
+            for event in journal.events():
+                if since is None or event["at"] >= since:
+                    print(json.dumps(event))
+        else:
+            print(json.dumps(report(journal, since), indent=2))
+    finally:
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import itertools
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+MEMORY_LOG_INTERVAL = int(os.getenv("MEMORY_LOG_INTERVAL_MINUTES", "60")) * 60
+SIZE_SAMPLE = 200
+TRACE_FRAMES = 5
+TRACE_TOP = 10
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes held by `obj` and everything it references through
+    containers and __slots__, counting shared objects once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            deep_sizeof(key, seen) + deep_sizeof(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(
+            deep_sizeof(getattr(obj, name, None), seen) for name in obj.__slots__
+        )
+    return size
+
+
+def store_bytes(store, sample=SIZE_SAMPLE):
+    """Estimates a BoundedStore's bytes from the `sample` most recently used
+    entries, so a gauge stays cheap on a full store."""
+    with store.lock:
+        count = len(store.entries)
+        entries = list(itertools.islice(reversed(store.entries.items()), sample))
+        table = sys.getsizeof(store.entries)
+    if not entries:
+        return table
+    seen = set()
+    sampled = sum(deep_sizeof(entry, seen) for entry in entries)
+    return table + sampled * count // len(entries)
+
+
+def rss_bytes():
+    """Current resident set size, or the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryMonitor:
+    """Gauges for where the bot's memory goes, and tracemalloc diffs that
+    can be taken while it runs.
+
+    `reminders` is the scheduler holding the pending reminders, and `sheets`
+    the SheetManager whose Sheets calls and queued writes are reported.
+    """
+
+    def __init__(self, ticket_manager, reminders, sheets=None):
+        self.ticket_manager = ticket_manager
+        self.reminders = reminders
+        self.sheets = sheets
+        self.baseline = None
+        self.lock = threading.Lock()
+
+    def gauges(self):
+        stats = self.ticket_manager.stats()
+        stores = {}
+        for name, store in self.ticket_manager.stores().items():
+            stores[name] = {"size": len(store), "approx_bytes": store_bytes(store)}
+        for name, store_stats in stats.items():
+            if name not in stores and "size" in store_stats:
+                stores[name] = {"size": store_stats["size"]}
+        index = getattr(self.ticket_manager, "index", None)
+        if index is not None:
+            with index.lock:
+                stores["index"] = {
+                    "size": sum(len(v) for v in index.keys_by_field.values()),
+                    "approx_bytes": deep_sizeof(index.keys_by_field),
+                }
+        return {
+            "rss_bytes": rss_bytes(),
+            "threads": threading.active_count(),
+            "pending_reminders": len(self.reminders),
+            "stores": stores,
+            "sheets": self.sheets.stats() if self.sheets else None,
+            "tracing": tracemalloc.is_tracing(),
+        }
+
+    def trace(self):
+        """Starts tracing and takes a baseline on the first call; later calls
+        return the top allocation growth since that baseline."""
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+                self.baseline = tracemalloc.take_snapshot()
+                return ["Started tracemalloc; run trace again to see the growth."]
+            snapshot = tracemalloc.take_snapshot()
+            stats = snapshot.compare_to(self.baseline, "lineno")
+            traced, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced {traced / 1024:.0f} KB (peak {peak / 1024:.0f} KB)"]
+        lines += [str(stat) for stat in stats[:TRACE_TOP]]
+        return lines
+
+    def stop_trace(self):
+        with self.lock:
+            tracemalloc.stop()
+            self.baseline = None
+
+    def report(self):
+        gauges = self.gauges()
+        lines = [
+            f"RSS {gauges['rss_bytes'] / 2**20:.1f} MB, "
+            f"{gauges['threads']} threads, "
+            f"{gauges['pending_reminders']} pending reminders"
+        ]
+        for name, store in gauges["stores"].items():
+            line = f"{name}: {store['size']} entries"
+            if "approx_bytes" in store:
+                line += f", ~{store['approx_bytes'] / 2**20:.1f} MB"
+            lines.append(line)
+        sheets = gauges["sheets"]
+        if sheets:
+            calls = sheets["sheets_calls"]
+            lines.append(
+                f"sheets: {calls['calls']} calls ({calls['throttled']} throttled, "
+                f"{calls['retried']} retried, {calls['failed']} failed), "
+                f"{sheets['pending_sheet_writes']} queued writes"
+            )
+        return lines
+
+    def log_report(self, trace=False):
+        """Logs the gauges, and the trace diff when tracing (or starts
+        tracing if `trace` is set)."""
+        try:
+            for line in self.report():
+                logging.info(f"Memory: {line}")
+            if trace or tracemalloc.is_tracing():
+                for line in self.trace():
+                    logging.info(f"Memory trace: {line}")
+        except Exception as e:
+            logging.error(f"Failed to report memory: {str(e)}")
+
+    def handle_signal(self, signum, frame):
+        # Snapshots are slow and logging takes locks the interrupted code may
+        # hold, so the handler only hands the report to a thread.
+        threading.Thread(
+            target=self.log_report,
+            kwargs={"trace": True},
+            name="memory-report",
+            daemon=True,
+        ).start()
+
+    def run_logging(self):
+        while True:
+            time.sleep(MEMORY_LOG_INTERVAL)
+            self.log_report()
+
+    def start_logging(self):
+        if MEMORY_LOG_INTERVAL <= 0:
+            return None
+        thread = threading.Thread(
+            target=self.run_logging, name="memory-gauges", daemon=True
+        )
+        thread.start()
+        return thread
@@ -0,0 +1,166 @@
+"""Rebuilds open tickets from the bot's own messages in Slack.
+
+Every ticket message carries its ticket as Slack message metadata, and every
+reflected message names the ticket it mirrors. When the local ticket state is
+gone, `recover_tickets` pages through conversations.history for a bounded
+window, in parallel time slices, and restores the open tickets, the payloads
+behind their buttons and their reflected message timestamps.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from slack_sdk.errors import SlackApiError
+
+from tickets import OPEN_STATUSES, TICKET_TTL, TicketPayload
+
+TICKET_EVENT = "hiops_ticket"
+REFLECTED_EVENT = "hiops_reflected"
+METADATA_FIELDS = (
+    "unique_id",
+    "ticket_id",
+    "reporter",
+    "assignee",
+    "category",
+    "issue_category",
+    "status",
+    "files",
+)
+RECOVERY_MODE = os.getenv("TICKET_RECOVERY", "auto")
+RECOVERY_WINDOW = float(os.getenv("RECOVERY_WINDOW_HOURS", TICKET_TTL / 3600)) * 3600
+RECOVERY_WORKERS = int(os.getenv("RECOVERY_WORKERS", "4"))
+HISTORY_PAGE_SIZE = 200
+
+
+def ticket_metadata(ticket, payload_key=None, payload=None):
+    """Message metadata for a ticket message: the ticket's routing fields and
+    the payload behind the message's buttons."""
+    event_payload = {}
+    for name in METADATA_FIELDS:
+        value = getattr(ticket, name)
+        if value is not None:
+            event_payload[name] = value
+    if payload_key and payload:
+        event_payload["payload_key"] = payload_key
+        event_payload["payload"] = payload.to_dict()
+    return {"event_type": TICKET_EVENT, "event_payload": event_payload}
+
+
+def reflected_metadata(key, ticket_id):
+    """Message metadata for a reflected message, stored on the ticket at `key`."""
+    return {
+        "event_type": REFLECTED_EVENT,
+        "event_payload": {"key": key, "ticket_id": ticket_id},
+    }
+
+
+def retry_after(error):
+    for name, value in error.response.headers.items():
+        if name.lower() == "retry-after":
+            return int(value)
+    return 1
+
+
+def read_history(client, channel, oldest, latest):
+    """Returns the messages with ticket metadata posted to `channel` between
+    `oldest` and `latest`, waiting out rate limits."""
+    messages = []
+    cursor = None
+    while True:
+        try:
+            response = client.conversations_history(
+                channel=channel,
+                oldest=f"{oldest:.6f}",
+                latest=f"{latest:.6f}",
+                inclusive=True,
+                limit=HISTORY_PAGE_SIZE,
+                cursor=cursor,
+            )
+        except SlackApiError as e:
+            if e.response.status_code != 429:
+                logging.error(f"Failed to read the history of {channel}: {str(e)}")
+                return messages
+            time.sleep(retry_after(e))
+            continue
+        for message in response["messages"]:
+            metadata = message.get("metadata") or {}
+            if metadata.get("event_type") in (TICKET_EVENT, REFLECTED_EVENT):
+                messages.append(message)
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not response.get("has_more") or not cursor:
+            return messages
+
+
+def recovery_due(ticket_manager, mode=RECOVERY_MODE):
+    """Whether to recover at startup: on every start in mode "always", and
+    only when there is no ticket state in mode "auto"."""
+    if mode == "always":
+        return True
+    return mode == "auto" and not ticket_manager.stats()["tickets"]["size"]
+
+
+def recover_tickets(
+    client,
+    ticket_manager,
+    channels,
+    window=RECOVERY_WINDOW,
+    workers=RECOVERY_WORKERS,
+):
+    """Restores the open tickets posted to `channels` in the last `window`
+    seconds that `ticket_manager` does not know. Returns how many it restored.
+
+    Each channel's window is split into `workers` slices read in parallel.
+    """
+    started = time.time()
+    step = window / workers
+    slices = [
+        (channel, started - window + i * step, started - window + (i + 1) * step)
+        for channel in dict.fromkeys(channels)
+        for i in range(workers)
+    ]
+    tickets = {}
+    reflected = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for messages in executor.map(lambda s: read_history(client, *s), slices):
+            for message in messages:
+                metadata = message["metadata"]
+                fields = metadata["event_payload"]
+                if metadata["event_type"] == TICKET_EVENT:
+                    tickets[message["ts"]] = fields
+                    continue
+                # Keep the newest reflected message of each ticket.
+                ticket_id = fields.get("ticket_id")
+                newest = reflected.get(ticket_id)
+                if newest is None or float(message["ts"]) > float(newest[1]):
+                    reflected[ticket_id] = (fields["key"], message["ts"])
+
+    restored = 0
+    for thread_ts, fields in tickets.items():
+        if fields.get("status", "unassigned") not in OPEN_STATUSES:
+            continue
+        if ticket_manager.get_field(thread_ts, "ticket_id") is not None:
+            continue
+        record = {name: fields[name] for name in METADATA_FIELDS if name in fields}
+        payload = fields.get("payload")
+        if payload:
+            if ticket_manager.get_payload(fields["payload_key"]) is None:
+                ticket_manager.store_payload(
+                    TicketPayload.from_dict(payload), fields["payload_key"]
+                )
+            if payload.get("user_input") is not None:
+                record["user_input"] = payload["user_input"]
+        # Handlers run meanwhile, so keep whatever they have changed.
+        ticket_manager.backfill(
+            thread_ts, event="recovered", created_at=float(thread_ts), **record
+        )
+        restored += 1
+        if record.get("ticket_id") in reflected:
+            key, reflected_ts = reflected[record["ticket_id"]]
+            ticket_manager.backfill(key, event="recovered", reflected_ts=reflected_ts)
+    logging.info(
+        f"Recovered {restored} open tickets from {len(tickets)} ticket messages "
+        f"in {time.time() - started:.1f}s"
+    )
+    return restored
@@ -0,0 +1,149 @@
+"""Delayed work for the bot, run by one thread in deadline order.
+
+Pending calls sit in a min-heap keyed by their deadline, so the thread and
+memory cost stays the same however many reminders are waiting. The clock is
+a parameter: pass a `VirtualClock` and call `run_due` after advancing it to
+run the scheduler deterministically without its thread.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class VirtualClock:
+    """Clock that only moves when `advance` is called."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class ScheduledCall:
+    """Handle for a pending call; `cancel` drops it before it runs."""
+
+    __slots__ = ("scheduler", "deadline", "seq", "key", "function", "args")
+
+    def __init__(self, scheduler, deadline, seq, key, function, args):
+        self.scheduler = scheduler
+        self.deadline = deadline
+        self.seq = seq
+        self.key = key
+        self.function = function
+        self.args = args
+
+    def __lt__(self, other):
+        # The sequence number keeps equal deadlines in scheduling order.
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+    @property
+    def pending(self):
+        return self.function is not None
+
+    def cancel(self):
+        """Returns False if the call already ran or was cancelled."""
+        return self.scheduler.cancel(self)
+
+
+class Scheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.keyed = {}
+        self.cancelled = 0
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def call_later(self, delay, function, *args, key=None):
+        """Runs `function(*args)` on the scheduler thread after `delay` seconds
+        and returns its ScheduledCall. A call with a `key` replaces the pending
+        call with that key, and can be found again with `pending`."""
+        with self.condition:
+            if key is not None and key in self.keyed:
+                self.cancel(self.keyed[key])
+            call = ScheduledCall(
+                self, self.clock() + delay, next(self.counter), key, function, args
+            )
+            heapq.heappush(self.heap, call)
+            if key is not None:
+                self.keyed[key] = call
+            self.condition.notify()
+            return call
+
+    def pending(self, key):
+        with self.condition:
+            return self.keyed.get(key)
+
+    def release(self, call):
+        # Drops the references a call holds; the caller holds the condition.
+        call.function = None
+        call.args = None
+        if call.key is not None and self.keyed.get(call.key) is call:
+            del self.keyed[call.key]
+
+    def cancel(self, call):
+        with self.condition:
+            if not call.pending:
+                return False
+            self.release(call)
+            # Cancelled calls stay in the heap until popped, unless they
+            # make up most of it.
+            self.cancelled += 1
+            if self.cancelled * 2 > len(self.heap):
+                self.heap = [entry for entry in self.heap if entry.pending]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+            return True
+
+    def pop_due(self):
+        due = []
+        with self.condition:
+            now = self.clock()
+            while self.heap and self.heap[0].deadline <= now:
+                call = heapq.heappop(self.heap)
+                if not call.pending:
+                    self.cancelled -= 1
+                    continue
+                due.append((call.function, call.args))
+                self.release(call)
+        return due
+
+    def run_due(self):
+        """Runs every call whose deadline has passed. Returns how many ran."""
+        due = self.pop_due()
+        for function, args in due:
+            try:
+                function(*args)
+            except Exception as e:
+                logging.error(f"Scheduled {function.__name__} failed: {str(e)}")
+        return len(due)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0].deadline > self.clock():
+                    timeout = (
+                        self.heap[0].deadline - self.clock() if self.heap else None
+                    )
+                    self.condition.wait(timeout)
+            self.run_due()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name="reminders", daemon=True
+            )
+            self.thread.start()
+        return self.thread
+
+    def __len__(self):
+        with self.condition:
+            return len(self.heap) - self.cancelled
@@ -0,0 +1,1008 @@
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from journal import JOURNAL_DIR, TicketJournal
+
+# Open tickets keep their routing state this long after the last write; once a
+# ticket is resolved, rejected or handed over only a short grace period is
+# left for late button clicks.
+TICKET_TTL = int(os.getenv("TICKET_TTL_HOURS", "168")) * 60 * 60
+CLOSED_TICKET_TTL = int(os.getenv("CLOSED_TICKET_TTL_MINUTES", "30")) * 60
+TICKET_STORE_MAX_ENTRIES = int(os.getenv("TICKET_STORE_MAX_ENTRIES", "20000"))
+PAYLOAD_STORE_MAX_ENTRIES = int(os.getenv("PAYLOAD_STORE_MAX_ENTRIES", "100000"))
+PAYLOAD_KEY_BYTES = 8
+PURGE_INTERVAL = 60
+TICKET_DB_PATH = os.getenv("TICKET_DB_PATH", "tickets.db")
+
+# "shared" keeps the state only in the SQLite file at TICKET_DB_PATH, so
+# several bot instances can point at the same file on a shared volume.
+TICKET_STATE_MODE = os.getenv("TICKET_STATE_MODE", "local")
+SHARED_BUSY_TIMEOUT = float(os.getenv("TICKET_DB_BUSY_TIMEOUT_SECONDS", "10"))
+
+# Tickets move from unassigned to assigned, and from either to one of the
+# closed statuses; a closed ticket never changes again.
+OPEN_STATUSES = ("unassigned", "assigned")
+CLOSED_STATUSES = ("resolved", "rejected", "handed_over")
+LOCK_STRIPES = 64
+
+INDEXED_FIELDS = (
+    "reporter",
+    "assignee",
+    "status",
+    "category",
+    "issue_category",
+    "ticket_id",
+)
+
+
+class TicketStateDB:
+    """Write-through copy of the ticket stores in a local SQLite database.
+
+    Values are stored as JSON with their wall-clock expiry, so a restarted
+    process can load every live entry back with a single query. A `shared`
+    database is opened for use by several processes at once: it keeps a
+    rollback journal instead of WAL, which needs shared memory on one host,
+    and waits up to `SHARED_BUSY_TIMEOUT` seconds for other writers.
+    """
+
+    def __init__(self, db_path, shared=False):
+        self.connection = sqlite3.connect(
+            db_path,
+            timeout=SHARED_BUSY_TIMEOUT if shared else 5,
+            check_same_thread=False,
+        )
+        self.lock = threading.RLock()
+        with self.lock, self.connection:
+            if shared:
+                self.connection.execute("PRAGMA journal_mode=DELETE")
+                self.connection.execute("PRAGMA synchronous=FULL")
+            else:
+                self.connection.execute("PRAGMA journal_mode=WAL")
+                self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ticket_state ("
+                "store TEXT, key TEXT, value TEXT, expires_at REAL, "
+                "PRIMARY KEY (store, key))"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS ticket_state_expires_at_idx "
+                "ON ticket_state (expires_at)"
+            )
+            if shared:
+                for field in INDEXED_FIELDS:
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS ticket_state_{field}_idx "
+                        f"ON ticket_state (store, json_extract(value, '$.{field}'))"
+                    )
+
+    def execute(self, query, params):
+        with self.lock:
+            # Inside transaction() errors must reach the caller, which rolls
+            # the whole transaction back.
+            if self.connection.in_transaction:
+                self.connection.execute(query, params)
+                return
+            try:
+                with self.connection:
+                    self.connection.execute(query, params)
+            except Exception as e:
+                logging.error(f"Failed to persist ticket state: {str(e)}")
+
+    @contextmanager
+    def transaction(self):
+        """Runs the block in an immediate transaction, which holds the write
+        lock on the database file from the first read to the commit."""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except Exception:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+
+    def put(self, store, key, value, expires_at):
+        self.execute(
+            "INSERT OR REPLACE INTO ticket_state (store, key, value, expires_at) "
+            "VALUES (?, ?, ?, ?)",
+            (store, key, json.dumps(value), expires_at),
+        )
+
+    def expires_at(self, store, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT expires_at FROM ticket_state WHERE store = ? AND key = ?",
+                (store, key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_expiry(self, store, key, expires_at):
+        self.execute(
+            "UPDATE ticket_state SET expires_at = ? WHERE store = ? AND key = ?",
+            (expires_at, store, key),
+        )
+
+    def delete(self, store, key):
+        self.execute(
+            "DELETE FROM ticket_state WHERE store = ? AND key = ?", (store, key)
+        )
+
+    def purge(self, store, now):
+        self.execute(
+            "DELETE FROM ticket_state WHERE store = ? AND expires_at <= ?",
+            (store, now),
+        )
+
+    def load(self, now):
+        # INSERT OR REPLACE gives a rewritten row a new rowid, so rowid order
+        # is the order entries were last written in.
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT store, key, value, expires_at FROM ticket_state "
+                "WHERE expires_at > ? ORDER BY rowid",
+                (now,),
+            ).fetchall()
+        return [
+            (store, key, json.loads(value), expires_at)
+            for store, key, value, expires_at in rows
+        ]
+
+    def values(self, store, now):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, value FROM ticket_state "
+                "WHERE store = ? AND expires_at > ?",
+                (store, now),
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def pop(self, store, key, now, match=None):
+        """Deletes the entry and returns its value, or None if it was gone,
+        so only one process gets a value that several race to take. With
+        `match`, an entry it rejects is left in place and None is returned."""
+        with self.transaction():
+            value = self.get(store, key, now)
+            if value is None or (match and not match(value)):
+                return None
+            self.delete(store, key)
+        return value
+
+    def get(self, store, key, now):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM ticket_state "
+                "WHERE store = ? AND key = ? AND expires_at > ?",
+                (store, key, now),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, store, criteria, since, now):
+        """Returns the live values with a ticket ID matching every criterion
+        (an indexed field and its accepted values), newest first."""
+        conditions = [
+            "store = ?",
+            "expires_at > ?",
+            "json_extract(value, '$.ticket_id') IS NOT NULL",
+        ]
+        params = [store, now]
+        for field, values in criteria.items():
+            if field not in INDEXED_FIELDS:
+                raise KeyError(field)
+            placeholders = ", ".join("?" for _ in values)
+            conditions.append(f"json_extract(value, '$.{field}') IN ({placeholders})")
+            params.extend(values)
+        if since is not None:
+            conditions.append("json_extract(value, '$.created_at') >= ?")
+            params.append(since)
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT value FROM ticket_state WHERE {' AND '.join(conditions)} "
+                "ORDER BY json_extract(value, '$.created_at') DESC",
+                params,
+            ).fetchall()
+        return [json.loads(value) for (value,) in rows]
+
+    def count(self, store, now):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM ticket_state WHERE store = ? AND expires_at > ?",
+                (store, now),
+            ).fetchone()[0]
+
+
+class BoundedStore:
+    """Key/value store with per-entry expiry and a least-recently-used cap.
+
+    Expired entries are dropped when read and by a sweep at most once every
+    `PURGE_INTERVAL` seconds; when the store is full the least recently used
+    entry makes room for the new one. With a `db`, every change is written
+    through to it under `name`, passing values through `encode` first.
+    `on_remove(key, value)` is called for every entry that expires, is
+    evicted or is popped.
+    """
+
+    def __init__(
+        self,
+        max_entries,
+        ttl,
+        clock=time.time,
+        name=None,
+        db=None,
+        encode=None,
+        on_remove=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.name = name
+        self.db = db
+        self.encode = encode
+        self.on_remove = on_remove
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_purge = clock()
+        self.counters = {"expired": 0, "evicted": 0}
+
+    def set(self, key, value, expires_at=None):
+        """Stores `value` for the TTL, or until `expires_at` if that is
+        sooner."""
+        now = self.clock()
+        expires_at = min(now + self.ttl, expires_at or float("inf"))
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            if self.db:
+                encoded = self.encode(value) if self.encode else value
+                self.db.put(self.name, key, encoded, expires_at)
+            self.evict_overflow()
+            if now - self.last_purge > PURGE_INTERVAL:
+                self.purge_expired(now)
+
+    def restore(self, key, value, expires_at):
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            self.evict_overflow()
+
+    def removed(self, key, value):
+        if self.on_remove:
+            self.on_remove(key, value)
+
+    def evict_overflow(self):
+        while len(self.entries) > self.max_entries:
+            key, (value, _) = self.entries.popitem(last=False)
+            self.counters["evicted"] += 1
+            self.removed(key, value)
+            if self.db:
+                self.db.delete(self.name, key)
+
+    def get(self, key, default=None, refresh=False):
+        """Returns the live value for `key`. With `refresh`, a read in the
+        second half of the entry's TTL starts it over."""
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= now:
+                del self.entries[key]
+                self.counters["expired"] += 1
+                self.removed(key, value)
+                return default
+            if refresh and expires_at - now < self.ttl / 2:
+                self.entries[key] = (value, now + self.ttl)
+                if self.db:
+                    self.db.set_expiry(self.name, key, now + self.ttl)
+            self.entries.move_to_end(key)
+            return value
+
+    def expires_at(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry[1] if entry else None
+
+    def expire_in(self, key, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                expires_at = min(expires_at, self.clock() + ttl)
+                self.entries[key] = (value, expires_at)
+                if self.db:
+                    self.db.set_expiry(self.name, key, expires_at)
+
+    def pop(self, key, match=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and match and not match(entry[0]):
+                return None
+            entry = self.entries.pop(key, None)
+            if entry:
+                self.removed(key, entry[0])
+            if entry and self.db:
+                self.db.delete(self.name, key)
+        return entry[0] if entry else None
+
+    def purge_expired(self, now):
+        expired = [key for key, (_, exp) in self.entries.items() if exp <= now]
+        for key in expired:
+            value, _ = self.entries.pop(key)
+            self.removed(key, value)
+        self.counters["expired"] += len(expired)
+        self.last_purge = now
+        if self.db:
+            self.db.purge(self.name, now)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, size=len(self.entries))
+
+
+def compact_files(files):
+    """Keeps only the file ID and the image URL the threads are built from."""
+    compacted = []
+    for file in files or []:
+        url = file.get("url_private", file.get("thumb_360", file.get("thumb_64")))
+        compacted.append({"id": file.get("id"), "url_private": url})
+    return compacted
+
+
+class TicketRecord:
+    """Everything the handlers keep about one ticket thread."""
+
+    __slots__ = (
+        "unique_id",
+        "status",
+        "reflected_ts",
+        "user_input",
+        "files",
+        "reporter",
+        "assignee",
+        "category",
+        "issue_category",
+        "ticket_id",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        unique_id=None,
+        status="unassigned",
+        reflected_ts=None,
+        user_input=None,
+        files=None,
+        reporter=None,
+        assignee=None,
+        category=None,
+        issue_category=None,
+        ticket_id=None,
+        created_at=None,
+        updated_at=None,
+    ):
+        self.unique_id = unique_id
+        self.status = status
+        self.reflected_ts = reflected_ts
+        self.user_input = user_input
+        self.files = files
+        self.reporter = reporter
+        self.assignee = assignee
+        self.category = category
+        self.issue_category = issue_category
+        self.ticket_id = ticket_id
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{k: v for k, v in values.items() if k in cls.__slots__})
+
+
+class TicketPayload:
+    """Context a Slack button, option or modal needs when it is used.
+
+    Messages carry only the short key the payload is stored under, so their
+    values stay small whatever the issue text or member count.
+    """
+
+    __slots__ = (
+        "category",
+        "reporter",
+        "reporter_ts",
+        "reported_at",
+        "ticket_id",
+        "unique_id",
+        "user_input",
+        "assignee",
+        "issue_category",
+        "channel_id",
+        "thread_ts",
+        "class_date",
+        "teacher_requested",
+        "teacher_replace",
+        "grade",
+        "slot_name",
+        "time_class",
+        "reason",
+        "direct_lead",
+        "stem_lead",
+        "full_name",
+        "issue_type",
+        "urgency_level",
+        "incident_at",
+        "conversation_id",
+        "support_id",
+        "staff_ts",
+        "chat_started_ts",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"Unknown payload fields: {', '.join(fields)}")
+
+    def to_dict(self):
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if getattr(self, name) is not None
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{k: v for k, v in values.items() if k in cls.__slots__})
+
+    def copy(self, **changes):
+        return TicketPayload(**dict(self.to_dict(), **changes))
+
+
+class TicketIndex:
+    """Secondary indexes from reporter, assignee, status, category and ticket
+    ID to the keys of the tickets holding them.
+
+    Only records with a ticket ID are indexed, which leaves out the helper
+    records kept under other keys (like an emergency's DM ts).
+    """
+
+    def __init__(self):
+        self.keys_by_field = {field: {} for field in INDEXED_FIELDS}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def entries(record):
+        if record is None or record.ticket_id is None:
+            return {}
+        return {
+            field: getattr(record, field)
+            for field in INDEXED_FIELDS
+            if getattr(record, field) is not None
+        }
+
+    def add(self, key, entries):
+        with self.lock:
+            for field, value in entries.items():
+                self.keys_by_field[field].setdefault(value, set()).add(key)
+
+    def remove(self, key, entries):
+        with self.lock:
+            for field, value in entries.items():
+                keys = self.keys_by_field[field].get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.keys_by_field[field][value]
+
+    def lookup(self, field, values):
+        with self.lock:
+            keys = set()
+            for value in values:
+                keys.update(self.keys_by_field[field].get(value, ()))
+            return keys
+
+    def stats(self):
+        with self.lock:
+            return {field: len(values) for field, values in self.keys_by_field.items()}
+
+
+def event_for(fields, had_ticket_id):
+    """Names the lifecycle event a change to a ticket record stands for."""
+    if "status" in fields:
+        return fields["status"]
+    if not had_ticket_id and fields.get("ticket_id"):
+        return "created"
+    if "issue_category" in fields:
+        return "categorized"
+    return "updated"
+
+
+def reminder_at_stage(stage):
+    """Matches stored reminders at `stage`, or any reminder if it is None."""
+    if stage is None:
+        return None
+    return lambda reminder: reminder.get("stage") == stage
+
+
+def missing_fields(record, fields):
+    """The `fields` that `record` has no value for. An existing record keeps
+    its status, which a handler may have moved on."""
+    if record is None:
+        return fields
+    return {
+        name: value
+        for name, value in fields.items()
+        if name != "status" and getattr(record, name) is None
+    }
+
+
+class TicketManager:
+    """Routing state for tickets, one record per key (mostly the ops thread ts).
+
+    Pass `db_path=None` to keep the state in memory only. Every change is
+    also appended to the journal in `journal_dir` (None turns it off), which
+    rebuilds the state at startup when there is no database state to load.
+    """
+
+    # Stores written by earlier versions, which kept one table per field.
+    legacy_fields = {
+        "reflected_timestamps": "reflected_ts",
+        "user_inputs": "user_input",
+        "ticket_status": "status",
+        "files": "files",
+        "unique_id": "unique_id",
+    }
+
+    def __init__(
+        self,
+        db_path=TICKET_DB_PATH,
+        max_entries=TICKET_STORE_MAX_ENTRIES,
+        ttl=TICKET_TTL,
+        closed_ttl=CLOSED_TICKET_TTL,
+        clock=time.time,
+        journal_dir=JOURNAL_DIR,
+    ):
+        self.closed_ttl = closed_ttl
+        self.clock = clock
+        self.db = TicketStateDB(db_path) if db_path else None
+        self.journal = TicketJournal(journal_dir) if journal_dir else None
+        self.index = TicketIndex()
+        self.tickets = BoundedStore(
+            max_entries,
+            ttl,
+            clock,
+            "tickets",
+            self.db,
+            TicketRecord.to_dict,
+            on_remove=self.unindex,
+        )
+        self.payloads = BoundedStore(
+            PAYLOAD_STORE_MAX_ENTRIES,
+            ttl,
+            clock,
+            "payloads",
+            self.db,
+            TicketPayload.to_dict,
+        )
+        self.reminders = BoundedStore(max_entries, ttl, clock, "reminders", self.db)
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        if self.db:
+            self.load()
+        if self.journal and not len(self.tickets):
+            self.replay_journal()
+
+    def load(self):
+        rows = self.db.load(self.clock())
+        legacy = {}
+        for name, key, value, expires_at in rows:
+            if name == "tickets":
+                record = TicketRecord.from_dict(value)
+                self.tickets.restore(key, record, expires_at)
+                self.index.add(key, self.index.entries(record))
+            elif name == "payloads":
+                payload = TicketPayload.from_dict(value)
+                self.payloads.restore(key, payload, expires_at)
+            elif name == "reminders":
+                self.reminders.restore(key, value, expires_at)
+            elif name in self.legacy_fields:
+                record, record_expires_at = legacy.get(key, (TicketRecord(), 0))
+                if name == "files":
+                    value = compact_files(value)
+                setattr(record, self.legacy_fields[name], value)
+                legacy[key] = (record, max(record_expires_at, expires_at))
+        for key, (record, expires_at) in legacy.items():
+            self.tickets.restore(key, record, expires_at)
+            self.db.put("tickets", key, record.to_dict(), expires_at)
+        for name in self.legacy_fields:
+            self.db.purge(name, float("inf"))
+        logging.info(f"Loaded {len(self.tickets)} tickets")
+
+    def replay_journal(self):
+        """Rebuilds the tickets from the latest snapshot and the events
+        journaled after it, folding each event's fields the way apply does."""
+        seq, entries = self.journal.latest_snapshot()
+        state = OrderedDict((key, (values, exp)) for key, values, exp in entries)
+        for event in self.journal.events(seq):
+            at = event["at"]
+            values, _ = state.pop(event["key"], ({"created_at": at}, None))
+            values = dict(values, **event["fields"])
+            values["updated_at"] = at
+            expires_at = at + self.tickets.ttl
+            if event["fields"].get("status") in CLOSED_STATUSES:
+                expires_at = min(expires_at, at + self.closed_ttl)
+            state[event["key"]] = (values, expires_at)
+        now = self.clock()
+        for key, (values, expires_at) in state.items():
+            if expires_at <= now:
+                continue
+            record = TicketRecord.from_dict(values)
+            self.tickets.restore(key, record, expires_at)
+            self.index.add(key, self.index.entries(record))
+            if self.db:
+                self.db.put("tickets", key, record.to_dict(), expires_at)
+        logging.info(f"Replayed {len(self.tickets)} tickets from the journal")
+
+    def record_event(self, thread_ts, fields, event, had_ticket_id, now):
+        if not self.journal:
+            return
+        event = event or event_for(fields, had_ticket_id)
+        self.journal.append(event, thread_ts, fields, now)
+        if self.journal.due_snapshot():
+            self.snapshot()
+
+    def snapshot(self):
+        # Changes reach the store before the journal, so every event up to
+        # `seq` is already in the copied records; later ones replay on top.
+        seq = self.journal.seq
+        with self.tickets.lock:
+            entries = [
+                [key, record.to_dict(), expires_at]
+                for key, (record, expires_at) in self.tickets.entries.items()
+            ]
+        threading.Thread(
+            target=self.write_snapshot, args=(seq, entries), daemon=True
+        ).start()
+
+    def write_snapshot(self, seq, entries):
+        try:
+            self.journal.write_snapshot(seq, entries)
+        except Exception as e:
+            logging.error(f"Failed to snapshot the ticket journal: {str(e)}")
+
+    def get_ticket(self, thread_ts):
+        """Returns the ticket's record, or an empty one for unknown keys."""
+        return self.tickets.get(thread_ts) or TicketRecord()
+
+    def lock_for(self, thread_ts):
+        return self.locks[hash(thread_ts) % len(self.locks)]
+
+    def unindex(self, thread_ts, record):
+        self.index.remove(thread_ts, self.index.entries(record))
+
+    def apply(self, thread_ts, fields, event=None):
+        now = self.clock()
+        record = self.tickets.get(thread_ts) or TicketRecord(created_at=now)
+        had_ticket_id = record.ticket_id is not None
+        was_closed = record.status in CLOSED_STATUSES
+        old_entries = self.index.entries(record)
+        for name, value in fields.items():
+            setattr(record, name, value)
+        record.updated_at = now
+        self.index.remove(thread_ts, old_entries)
+        self.index.add(thread_ts, self.index.entries(record))
+        # Later updates to a closed ticket keep its shorter expiry.
+        keep_expiry = was_closed and record.status in CLOSED_STATUSES
+        expires_at = self.tickets.expires_at(thread_ts) if keep_expiry else None
+        self.tickets.set(thread_ts, record, expires_at)
+        if fields.get("status") in CLOSED_STATUSES:
+            self.tickets.expire_in(thread_ts, self.closed_ttl)
+        self.record_event(thread_ts, fields, event, had_ticket_id, now)
+        return record
+
+    def update(self, thread_ts, event=None, **fields):
+        """Sets `fields` on the ticket. The journal names the change after
+        `event`, or after the fields when no event is given."""
+        with self.lock_for(thread_ts):
+            return self.apply(thread_ts, fields, event)
+
+    def transition(self, thread_ts, from_statuses, to_status, **fields):
+        """Atomically moves a ticket from one of `from_statuses` to `to_status`.
+
+        Returns the updated record, or None if the ticket is in any other
+        status, meaning a concurrent handler has already moved it.
+        """
+        with self.lock_for(thread_ts):
+            record = self.tickets.get(thread_ts)
+            status = record.status if record else "unassigned"
+            if status not in from_statuses:
+                return None
+            return self.apply(thread_ts, dict(fields, status=to_status))
+
+    def backfill(self, thread_ts, event=None, **fields):
+        """Sets only the `fields` the ticket has no value for, so restoring a
+        ticket never undoes a change a handler has made meanwhile."""
+        with self.lock_for(thread_ts):
+            fields = missing_fields(self.tickets.get(thread_ts), fields)
+            return self.apply(thread_ts, fields, event)
+
+    def get_field(self, thread_ts, name, default=None):
+        record = self.tickets.get(thread_ts)
+        value = getattr(record, name) if record else None
+        return default if value is None else value
+
+    def store_reflected_ts(self, thread_ts, reflected_ts):
+        self.update(thread_ts, reflected_ts=reflected_ts)
+
+    def get_reflected_ts(self, thread_ts):
+        return self.get_field(thread_ts, "reflected_ts")
+
+    def clear_reflected_ts(self, thread_ts):
+        self.update(thread_ts, reflected_ts=None)
+
+    def store_unique_id(self, thread_ts, id):
+        self.update(thread_ts, unique_id=id)
+
+    def get_unique_id(self, thread_ts):
+        return self.get_field(thread_ts, "unique_id")
+
+    def store_user_input(self, thread_ts, user_input):
+        self.update(thread_ts, user_input=user_input)
+
+    def get_user_input(self, thread_ts):
+        return self.get_field(thread_ts, "user_input")
+
+    def clear_user_input(self, thread_ts):
+        self.update(thread_ts, user_input=None)
+
+    def update_ticket_status(self, thread_ts, status):
+        self.update(thread_ts, status=status)
+
+    def get_ticket_status(self, thread_ts):
+        return self.get_field(thread_ts, "status", "unassigned")
+
+    def clear_ticket_status(self, thread_ts):
+        self.update(thread_ts, status="unassigned")
+
+    def store_files(self, thread_ts, files):
+        self.update(thread_ts, files=compact_files(files))
+
+    def get_files(self, thread_ts):
+        return self.get_field(thread_ts, "files")
+
+    def store_payload(self, payload, key=None):
+        """Stores `payload` and returns the short key to put in Slack. A
+        `key` is only passed when restoring a payload already in Slack."""
+        key = key or secrets.token_urlsafe(PAYLOAD_KEY_BYTES)
+        self.payloads.set(key, payload)
+        return key
+
+    def get_payload(self, key):
+        # Buttons stay clickable while they are used, however old the ticket.
+        return self.payloads.get(key, refresh=True)
+
+    def store_reminder(self, key, values, due_at):
+        """Keeps a pending reminder, on disk with a database, until it is
+        claimed or dropped."""
+        self.reminders.set(key, dict(values, due_at=due_at))
+
+    def claim_reminder(self, key, stage=None):
+        """Takes the stored reminder and returns it, or None if it is gone,
+        meaning it was dropped or another instance already claimed it. With
+        `stage`, a reminder stored for another stage is left in place."""
+        return self.reminders.pop(key, reminder_at_stage(stage))
+
+    def drop_reminder(self, key):
+        self.reminders.pop(key)
+
+    def pending_reminders(self):
+        """Returns (key, values) for every stored reminder, earliest first."""
+        now = self.clock()
+        with self.reminders.lock:
+            reminders = [
+                (key, values)
+                for key, (values, expires_at) in self.reminders.entries.items()
+                if expires_at > now
+            ]
+        return sorted(reminders, key=lambda reminder: reminder[1]["due_at"])
+
+    def find(self, since=None, **criteria):
+        """Returns the tickets matching every criterion, newest first.
+
+        Each criterion names an indexed field and a value or a tuple of
+        accepted values; `since` drops tickets created before that time.
+        """
+        keys = None
+        for field, values in criteria.items():
+            if not isinstance(values, tuple):
+                values = (values,)
+            matches = self.index.lookup(field, values)
+            keys = matches if keys is None else keys & matches
+            if not keys:
+                return []
+        records = [self.tickets.get(key) for key in keys or ()]
+        records = [
+            record
+            for record in records
+            if record is not None
+            and (since is None or (record.created_at or 0) >= since)
+        ]
+        return sorted(records, key=lambda record: record.created_at or 0, reverse=True)
+
+    def stores(self):
+        return {
+            "tickets": self.tickets,
+            "payloads": self.payloads,
+            "reminders": self.reminders,
+        }
+
+    def stats(self):
+        return {
+            "tickets": self.tickets.stats(),
+            "payloads": self.payloads.stats(),
+            "reminders": self.reminders.stats(),
+            "index": self.index.stats(),
+        }
+
+
+class SharedTicketManager(TicketManager):
+    """TicketManager for several bot instances behind one Slack app.
+
+    The SQLite file at `db_path` (on a volume every instance mounts) is the
+    only copy of the state: every read goes to it, and every change reads,
+    checks and writes the record inside one immediate transaction, so a
+    transition stays atomic across processes. There is no per-process cap;
+    records are dropped once their TTL runs out.
+    """
+
+    def __init__(
+        self,
+        db_path=TICKET_DB_PATH,
+        ttl=TICKET_TTL,
+        closed_ttl=CLOSED_TICKET_TTL,
+        clock=time.time,
+        journal_dir=JOURNAL_DIR,
+    ):
+        self.ttl = ttl
+        self.closed_ttl = closed_ttl
+        self.clock = clock
+        self.db = TicketStateDB(db_path, shared=True)
+        # Nothing is kept in memory to snapshot, so the journal is only
+        # appended to, as this instance's history. Instances sharing one
+        # journal volume each write under their own host name.
+        self.journal = (
+            TicketJournal(
+                os.path.join(journal_dir, socket.gethostname()),
+                snapshot_every=float("inf"),
+            )
+            if journal_dir
+            else None
+        )
+        self.last_purge = clock()
+
+    def read(self, thread_ts):
+        value = self.db.get("tickets", thread_ts, self.clock())
+        return TicketRecord.from_dict(value) if value else None
+
+    def get_ticket(self, thread_ts):
+        return self.read(thread_ts) or TicketRecord()
+
+    def get_field(self, thread_ts, name, default=None):
+        record = self.read(thread_ts)
+        value = getattr(record, name) if record else None
+        return default if value is None else value
+
+    def write(self, thread_ts, fields, from_statuses=None, event=None, backfill=False):
+        now = self.clock()
+        with self.db.transaction():
+            record = self.read(thread_ts)
+            if backfill:
+                fields = missing_fields(record, fields)
+            record = record or TicketRecord(created_at=now)
+            if from_statuses is not None and record.status not in from_statuses:
+                return None
+            had_ticket_id = record.ticket_id is not None
+            was_closed = record.status in CLOSED_STATUSES
+            for name, value in fields.items():
+                setattr(record, name, value)
+            record.updated_at = now
+            if record.status not in CLOSED_STATUSES:
+                expires_at = now + self.ttl
+            elif was_closed:
+                # Later updates to a closed ticket keep its expiry.
+                expires_at = self.db.expires_at("tickets", thread_ts)
+            else:
+                expires_at = now + self.closed_ttl
+            self.db.put("tickets", thread_ts, record.to_dict(), expires_at)
+        self.record_event(thread_ts, fields, event, had_ticket_id, now)
+        self.purge_expired(now)
+        return record
+
+    def purge_expired(self, now):
+        if now - self.last_purge > PURGE_INTERVAL:
+            self.last_purge = now
+            self.db.purge("tickets", now)
+            self.db.purge("payloads", now)
+            self.db.purge("reminders", now)
+
+    def update(self, thread_ts, event=None, **fields):
+        return self.write(thread_ts, fields, event=event)
+
+    def transition(self, thread_ts, from_statuses, to_status, **fields):
+        return self.write(thread_ts, dict(fields, status=to_status), from_statuses)
+
+    def backfill(self, thread_ts, event=None, **fields):
+        return self.write(thread_ts, fields, event=event, backfill=True)
+
+    def store_payload(self, payload, key=None):
+        key = key or secrets.token_urlsafe(PAYLOAD_KEY_BYTES)
+        now = self.clock()
+        self.db.put("payloads", key, payload.to_dict(), now + self.ttl)
+        self.purge_expired(now)
+        return key
+
+    def get_payload(self, key):
+        now = self.clock()
+        value = self.db.get("payloads", key, now)
+        if value is None:
+            return None
+        self.db.set_expiry("payloads", key, now + self.ttl)
+        return TicketPayload.from_dict(value)
+
+    def store_reminder(self, key, values, due_at):
+        now = self.clock()
+        self.db.put("reminders", key, dict(values, due_at=due_at), now + self.ttl)
+        self.purge_expired(now)
+
+    def claim_reminder(self, key, stage=None):
+        # Every instance loads the same reminders; the row is deleted in one
+        # transaction, so only one of them gets it.
+        return self.db.pop("reminders", key, self.clock(), reminder_at_stage(stage))
+
+    def drop_reminder(self, key):
+        self.db.delete("reminders", key)
+
+    def pending_reminders(self):
+        reminders = self.db.values("reminders", self.clock())
+        return sorted(reminders, key=lambda reminder: reminder[1]["due_at"])
+
+    def find(self, since=None, **criteria):
+        if not criteria:
+            return []
+        criteria = {
+            field: values if isinstance(values, tuple) else (values,)
+            for field, values in criteria.items()
+        }
+        values = self.db.find("tickets", criteria, since, self.clock())
+        return [TicketRecord.from_dict(value) for value in values]
+
+    def stores(self):
+        return {}
+
+    def stats(self):
+        now = self.clock()
+        return {
+            "tickets": {"size": self.db.count("tickets", now)},
+            "payloads": {"size": self.db.count("payloads", now)},
+            "reminders": {"size": self.db.count("reminders", now)},
+        }
+
+
+def create_ticket_manager(mode=TICKET_STATE_MODE):
+    if mode == "shared":
+        return SharedTicketManager()
+    return TicketManager()